@@ -1,28 +1,23 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, current_app, render_template, request, jsonify
+from flask.cli import with_appcontext
 from flask_cors import CORS
+import click
 from config import Config
-from database import db, init_db
+from database import db, init_db, setup_database, check_indexes
 from models import User
-from telegram_validation import validate_telegram_webapp_data
-from routes import api, is_authorized_telegram_user
+from routes import api, is_authorized_telegram_user, read_telegram_init_data
+from reference_cache import reference_cache
+from uploads import StreamingUploadRequest
+from compression import CompressionMiddleware
+import assets
+import metrics
+import sql_monitor
+import logging_setup
+from logging_setup import setup_logging
+import logging
 import os
 
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Настройка APPLICATION_ROOT для работы за префиксом (например, /form)
-# Приоритет: переменная окружения APPLICATION_ROOT > автоматическое определение
-if Config.APPLICATION_ROOT:
-    app.config['APPLICATION_ROOT'] = Config.APPLICATION_ROOT
-
-# Инициализация CORS
-CORS(app)
-
-# Регистрация Blueprint
-app.register_blueprint(api, url_prefix='/api')
-
-# Инициализация базы данных
-init_db(app)
+logger = logging.getLogger(__name__)
 
 
 class ReverseProxied:
@@ -45,56 +40,150 @@ class ReverseProxied:
         return self.app(environ, start_response)
 
 
-# Применяем middleware для поддержки префикса
-if Config.APPLICATION_ROOT:
-    app.wsgi_app = ReverseProxied(app.wsgi_app, script_name=Config.APPLICATION_ROOT)
-else:
-    app.wsgi_app = ReverseProxied(app.wsgi_app)
-
-
-@app.route('/')
 def index():
     """Главная страница с формой"""
     # Проверяем, является ли запрос от Telegram WebApp
     init_data = request.args.get('tgWebAppData') or request.headers.get('X-Telegram-Init-Data')
 
     if init_data and Config.TELEGRAM_BOT_TOKEN:
-        # Валидируем данные Telegram
-        if not validate_telegram_webapp_data(init_data, Config.TELEGRAM_BOT_TOKEN):
+        # Валидируем данные Telegram (подпись и разбор за один проход)
+        telegram_data = read_telegram_init_data(init_data)
+        if telegram_data is None:
             return render_template('index.html', error="Invalid Telegram WebApp data")
 
         # Извлекаем user_id из данных
         try:
-            import logging
-            logger = logging.getLogger(__name__)
-            from urllib.parse import parse_qs, unquote
-            parsed_data = parse_qs(unquote(init_data))
-            logger.info(f"index: parsed_data keys: {parsed_data.keys()}")
-            if 'user' in parsed_data:
-                import json
-                user_data = json.loads(parsed_data['user'][0])
-                telegram_user_id = user_data.get('id')
-                logger.info(f"index: extracted telegram_user_id={telegram_user_id}, type={type(telegram_user_id)}, user_data={user_data}")
-
+            telegram_user_id = telegram_data.user_id
+            if telegram_data.user is not None:
                 # Проверяем, есть ли пользователь в базе данных
                 if telegram_user_id and not is_authorized_telegram_user(telegram_user_id):
-                    logger.warning(f"index: access denied for telegram_user_id={telegram_user_id}")
+                    logger.warning("index: access denied for telegram_user_id=%s", telegram_user_id)
                     return render_template('index.html', error="Access denied: User is not registered in the system")
                 else:
-                    logger.info(f"index: access granted for telegram_user_id={telegram_user_id}")
+                    logger.info(
+                        "index: access granted for telegram_user_id=%s", telegram_user_id, extra={'sampled': True}
+                    )
         except Exception as e:
             # Если не удается извлечь данные, продолжаем без проверки
-            import logging
-            logger = logging.getLogger(__name__)
-            logger.error(f"index: error extracting telegram_user_id: {e}", exc_info=True)
-            pass
+            logger.error("index: error extracting telegram_user_id: %s", e, exc_info=True)
 
     return render_template('index.html')
 
 
+def discard_streamed_uploads(exc):
+    """Удаление файлов, принятых потоково, но не сохранённых обработчиком"""
+    request.discard_streamed_uploads()
+
+
+@click.command('init-db')
+@click.option('--seed', is_flag=True, help='Добавить тестовые данные в пустые таблицы')
+@with_appcontext
+def init_db_command(seed):
+    """Подготовка БД: ожидание готовности, миграции схемы, тестовые данные (--seed или SEED_TEST_DATA=true)"""
+    setup_database(seed=seed or Config.SEED_TEST_DATA)
+    click.echo('Database is up to date')
+
+
+@click.command('check-indexes')
+@with_appcontext
+def check_indexes_command():
+    """Проверка планов горячих запросов (EXPLAIN): используются нужные индексы, нет filesort"""
+    if db.engine.dialect.name != 'mysql':
+        raise click.ClickException('check-indexes requires MySQL')
+
+    failed = 0
+    for name, index_name, plan, ok in check_indexes():
+        click.echo(f"{'OK  ' if ok else 'FAIL'} {name}: key={plan.get('key')} (expected {index_name}), "
+                   f"rows={plan.get('rows')}, extra={plan.get('Extra')}")
+        failed += not ok
+    if failed:
+        raise click.ClickException(f'{failed} queries do not use the expected index')
+
+
+@click.command('build-assets')
+@click.option('--minify', is_flag=True, help='Минифицировать CSS и JS (пакеты rcssmin, rjsmin)')
+@with_appcontext
+def build_assets_command(minify):
+    """Сборка static/dist: CSS и JS с хэшем содержимого в имени и manifest.json"""
+    if minify and not assets.minify_available():
+        raise click.ClickException('--minify requires rcssmin and rjsmin')
+    manifest = assets.build_assets(current_app.static_folder, minify=minify)
+    for source, hashed in sorted(manifest.items()):
+        click.echo(f'{source} -> {assets.DIST_DIR}/{hashed}')
+
+
+def create_app():
+    """
+    Создание приложения.
+
+    Не обращается к БД: миграции и тестовые данные выполняет отдельная команда
+    flask --app app init-db, кэши прогреваются в каждом процессе (warm_caches).
+    """
+    setup_logging()
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    # Файлы /api/submit пишутся сразу в папку uploads, без промежуточного временного файла
+    app.request_class = StreamingUploadRequest
+
+    # Настройка APPLICATION_ROOT для работы за префиксом (например, /form)
+    # Приоритет: переменная окружения APPLICATION_ROOT > автоматическое определение
+    if Config.APPLICATION_ROOT:
+        app.config['APPLICATION_ROOT'] = Config.APPLICATION_ROOT
+
+    # Инициализация CORS
+    CORS(app)
+
+    # Регистрация Blueprint
+    app.register_blueprint(api, url_prefix='/api')
+    app.add_url_rule('/', 'index', index)
+    app.teardown_request(discard_streamed_uploads)
+    metrics.init_app(app)
+    logging_setup.init_app(app)
+    sql_monitor.init_app(app)
+    assets.init_app(app)
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(check_indexes_command)
+    app.cli.add_command(build_assets_command)
+
+    init_db(app)
+
+    # Сжатие ответов и статических файлов по Accept-Encoding
+    if Config.COMPRESSION_ENABLED:
+        app.wsgi_app = CompressionMiddleware(
+            app.wsgi_app,
+            static_folder=app.static_folder,
+            static_url_path=app.static_url_path,
+            cache_dir=Config.COMPRESSION_CACHE_DIR,
+            min_size=Config.COMPRESSION_MIN_SIZE,
+            gzip_level=Config.COMPRESSION_LEVEL,
+            brotli_quality=Config.COMPRESSION_BROTLI_QUALITY,
+            static_cache_control=assets.static_cache_control,
+        )
+
+    # Применяем middleware для поддержки префикса
+    if Config.APPLICATION_ROOT:
+        app.wsgi_app = ReverseProxied(app.wsgi_app, script_name=Config.APPLICATION_ROOT)
+    else:
+        app.wsgi_app = ReverseProxied(app.wsgi_app)
+
+    return app
+
+
+def warm_caches(app):
+    """Прогрев in-process кэшей процесса, чтобы первые запросы формы не ходили в БД"""
+    with app.app_context():
+        try:
+            reference_cache.warm()
+        except Exception as e:
+            logger.warning("Could not warm reference cache: %s", e)
+
+
 if __name__ == '__main__':
-    import os
     debug_mode = os.getenv('FLASK_ENV') == 'development' or os.getenv('DEBUG', 'False').lower() == 'true'
+    app = create_app()
+    # Встроенный сервер для разработки: как и раньше, БД готовится при запуске (с тестовыми данными)
+    with app.app_context():
+        setup_database(seed=True)
+    warm_caches(app)
     app.run(debug=debug_mode, host='0.0.0.0', port=5000)
-
-
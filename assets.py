@@ -0,0 +1,138 @@
+"""
+Статические файлы с хэшем содержимого в имени (static/dist).
+
+flask --app app build-assets копирует CSS и JS из static в static/dist под
+именами вида js/app.3f9c1e2a7b.js и пишет manifest.json (исходный путь ->
+путь с хэшем). В шаблонах ссылки строит asset_url(): по манифесту, если он есть,
+иначе обычный url_for('static'). Файл с хэшем в имени не меняется никогда,
+поэтому отдаётся с Cache-Control: immutable на год — повторное открытие формы
+в Telegram берёт CSS и JS из кэша без запросов к серверу.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from flask import current_app, request, url_for
+
+try:
+    import rcssmin
+    import rjsmin
+except ImportError:  # минификация необязательна: без пакетов файлы копируются как есть
+    rcssmin = rjsmin = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+FINGERPRINT_EXTENSIONS = ('.css', '.js')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_manifest = {'mtime': None, 'entries': {}}
+_manifest_lock = threading.Lock()
+
+
+def minify_available():
+    """Установлены ли пакеты rcssmin и rjsmin (build-assets --minify)"""
+    return rcssmin is not None
+
+
+def _minify(relative, data):
+    text = data.decode('utf-8')
+    if relative.endswith('.css'):
+        return rcssmin.cssmin(text).encode('utf-8')
+    return rjsmin.jsmin(text).encode('utf-8')
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+def build_assets(static_folder, minify=False):
+    """Записать файлы с хэшем в static/dist и manifest.json; возвращает манифест"""
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    manifest = {}
+
+    for root, dirs, files in os.walk(static_folder):
+        if root == static_folder and DIST_DIR in dirs:
+            dirs.remove(DIST_DIR)
+        for name in sorted(files):
+            if not name.endswith(FINGERPRINT_EXTENSIONS):
+                continue
+            source = os.path.join(root, name)
+            relative = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            if minify:
+                data = _minify(relative, data)
+
+            digest = hashlib.sha256(data).hexdigest()[:10]
+            stem, ext = os.path.splitext(relative)
+            hashed = f'{stem}.{digest}{ext}'
+            target = os.path.join(dist_folder, hashed)
+            # Файлы прошлых сборок не удаляются: их ещё может запросить страница, открытая до обновления
+            if not os.path.exists(target):
+                _write_atomic(target, data)
+            manifest[relative] = hashed
+
+    _write_atomic(os.path.join(dist_folder, MANIFEST_NAME),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def _load_manifest(static_folder):
+    """Манифест сборки; перечитывается, если manifest.json изменился (новая сборка без перезапуска)"""
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    if mtime == _manifest['mtime']:
+        return _manifest['entries']
+
+    with _manifest_lock:
+        if mtime != _manifest['mtime']:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                return {}
+            _manifest['entries'] = entries
+            _manifest['mtime'] = mtime
+        return _manifest['entries']
+
+
+def asset_url(filename):
+    """URL статического файла: версия с хэшем из манифеста или исходный файл, если сборки нет"""
+    hashed = _load_manifest(current_app.static_folder).get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=f'{DIST_DIR}/{hashed}')
+
+
+def is_fingerprinted(filename):
+    """Путь относительно static указывает на файл сборки с хэшем в имени"""
+    return filename.startswith(DIST_DIR + '/') and filename != f'{DIST_DIR}/{MANIFEST_NAME}'
+
+
+def static_cache_control(filename):
+    """Cache-Control статического файла (для готовых сжатых копий в compression.py)"""
+    return IMMUTABLE_CACHE_CONTROL if is_fingerprinted(filename) else 'no-cache'
+
+
+def _immutable_cache_headers(response):
+    # Только для файлов с хэшем в имени: их содержимое по этому URL никогда не меняется
+    if request.endpoint == 'static' and response.status_code in (200, 304) \
+            and is_fingerprinted((request.view_args or {}).get('filename', '')):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def init_app(app):
+    """Хелпер asset_url в шаблонах и долгое кэширование файлов static/dist"""
+    app.add_template_global(asset_url)
+    app.after_request(_immutable_cache_headers)
@@ -0,0 +1,63 @@
+"""
+In-process множество tg_id зарегистрированных пользователей.
+
+Проверка доступа выполняется на каждый рендер формы и каждую отправку, поэтому
+вместо запроса к users на каждый вызов воркер держит множество tg_id в памяти.
+Не чаще чем раз в AUTHORIZED_USERS_REFRESH_INTERVAL секунд выполняется дешёвый
+запрос «водяного знака» (COUNT(*), MAX(updated_at)); множество перечитывается,
+только если водяной знак изменился. create_user/update_user сбрасывают кэш сразу.
+"""
+import logging
+import threading
+import time
+from typing import FrozenSet, Optional, Tuple
+
+from sqlalchemy import func
+
+from config import Config
+from database import db
+from models import User
+
+logger = logging.getLogger(__name__)
+
+
+class AuthorizedUsersCache:
+    """Множество авторизованных tg_id, общее для всех потоков воркера"""
+
+    def __init__(self, refresh_interval: int):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._tg_ids: Optional[FrozenSet[int]] = None
+        self._watermark: Optional[Tuple] = None
+        self._checked_at = 0.0
+
+    def contains(self, tg_id: int) -> bool:
+        """Есть ли пользователь с данным tg_id"""
+        return int(tg_id) in self._get_tg_ids()
+
+    def invalidate(self):
+        """Сбросить кэш: следующая проверка перечитает пользователей из БД"""
+        with self._lock:
+            self._tg_ids = None
+            self._watermark = None
+
+    def _get_tg_ids(self) -> FrozenSet[int]:
+        tg_ids = self._tg_ids
+        if tg_ids is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            return tg_ids
+
+        with self._lock:
+            now = time.monotonic()
+            if self._tg_ids is not None and now - self._checked_at < self.refresh_interval:
+                return self._tg_ids
+
+            watermark = tuple(db.session.query(func.count(User.id), func.max(User.updated_at)).one())
+            if self._tg_ids is None or watermark != self._watermark:
+                self._tg_ids = frozenset(tg_id for (tg_id,) in db.session.query(User.tg_id))
+                self._watermark = watermark
+                logger.info("loaded %s users", len(self._tg_ids))
+            self._checked_at = now
+            return self._tg_ids
+
+
+authorized_users = AuthorizedUsersCache(Config.AUTHORIZED_USERS_REFRESH_INTERVAL)
@@ -0,0 +1,264 @@
+"""
+WSGI middleware сжатия ответов (gzip / br) по Accept-Encoding.
+
+- Динамические ответы (HTML, JSON, NDJSON, CSV, JS, CSS) сжимаются потоково,
+  по мере выдачи тела приложением; ответ целиком в памяти не собирается.
+- Ответы меньше min_size (по Content-Length), уже сжатые (Content-Encoding,
+  например готовые тела справочников), частичные (206) и без тела не трогаются.
+- Статические файлы сжимаются один раз с максимальной степенью и хранятся
+  в cache_dir; сжатая копия действительна, пока совпадает mtime исходного файла.
+"""
+import mimetypes
+import os
+import tempfile
+import zlib
+from email.utils import formatdate
+
+from werkzeug.http import parse_accept_header, parse_etags
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него используется только gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+    'application/javascript', 'application/json', 'application/x-ndjson', 'image/svg+xml',
+}
+CACHE_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+# Потоковый ответ: сжатые данные принудительно отдаются после каждых STREAM_FLUSH_SIZE байт исходного тела.
+# Сброс после каждой части ухудшает степень сжатия и тратит CPU на мелкие блоки
+STREAM_FLUSH_SIZE = 32 * 1024
+
+
+def _compressible(content_type):
+    return (content_type or '').split(';')[0].strip().lower() in COMPRESSIBLE_TYPES
+
+
+class _StreamCompressor:
+    """Потоковое сжатие тела ответа; flush_size — отдавать сжатые данные после стольких байт исходного тела"""
+
+    def __init__(self, encoding, level, flush_size=None):
+        self.flush_size = flush_size
+        self._unflushed = 0
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=level['br'])
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(level['gzip'], zlib.DEFLATED, 31)  # 31 — формат gzip
+
+    def compress(self, data):
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+        else:
+            out = self._zlib.compress(data)
+        if self.flush_size is None:
+            return out
+        self._unflushed += len(data)
+        if self._unflushed < self.flush_size:
+            return out
+        self._unflushed = 0
+        if self._brotli is not None:
+            return out + self._brotli.flush()
+        return out + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """Сжатие ответов приложения и кэш сжатых статических файлов"""
+
+    def __init__(self, app, static_folder=None, static_url_path='/static', cache_dir=None,
+                 min_size=1024, gzip_level=6, brotli_quality=4, static_cache_control=None):
+        self.app = app
+        self.static_folder = static_folder
+        # Cache-Control статического файла по пути относительно static_folder
+        self.static_cache_control = static_cache_control or (lambda filename: 'no-cache')
+        self.static_prefix = static_url_path.rstrip('/') + '/'
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), 'miniapp-static-cache')
+        self.min_size = min_size
+        # Динамические ответы — быстрое сжатие; статические файлы сжимаются один раз, поэтому максимально
+        self.dynamic_level = {'gzip': gzip_level, 'br': brotli_quality}
+        self.encodings = (['br'] if brotli is not None else []) + ['gzip']
+
+    def __call__(self, environ, start_response):
+        encoding = self._negotiate(environ)
+        if encoding is None:
+            return self._passthrough(environ, start_response)
+
+        if self.static_folder and environ.get('PATH_INFO', '').startswith(self.static_prefix):
+            response = self._serve_static(environ, start_response, encoding)
+            if response is not None:
+                return response
+
+        return self._compress(environ, start_response, encoding)
+
+    def _negotiate(self, environ):
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD', 'POST'):
+            return None
+        accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        best = accept.best_match(self.encodings + ['identity'], default='identity')
+        return None if best == 'identity' else best
+
+    def _passthrough(self, environ, start_response):
+        """Без сжатия: только Vary для сжимаемых ответов (ответ зависит от Accept-Encoding)"""
+        def _start_response(status, headers, exc_info=None):
+            header_names = {name.lower() for name, _ in headers}
+            if 'content-encoding' not in header_names and _compressible(_header(headers, 'Content-Type')):
+                headers = _add_vary(headers)
+            return start_response(status, headers, exc_info)
+
+        return self.app(environ, _start_response)
+
+    def _compress(self, environ, start_response, encoding):
+        state = {}
+
+        def _start_response(status, headers, exc_info=None):
+            state['started'] = True
+            if self._should_compress(status, headers):
+                content_length = _header(headers, 'Content-Length')
+                headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+                headers = _add_vary(headers) + [('Content-Encoding', encoding)]
+                etag = _header(headers, 'ETag')
+                if etag and etag.endswith('"'):
+                    # У сжатого варианта свой ETag
+                    headers = [(n, v) for n, v in headers if n.lower() != 'etag'] + [('ETag', f'{etag[:-1]}-{encoding}"')]
+                # Без Content-Length (потоковый ответ) сжатые данные отдаются порциями по мере выдачи тела
+                state['compressor'] = _StreamCompressor(
+                    encoding, self.dynamic_level, flush_size=STREAM_FLUSH_SIZE if content_length is None else None)
+            elif _compressible(_header(headers, 'Content-Type')) and not _header(headers, 'Content-Encoding'):
+                headers = _add_vary(headers)
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, _start_response)
+        if environ.get('REQUEST_METHOD') == 'HEAD':
+            return app_iter
+        if state.get('started') and 'compressor' not in state:
+            # Ответ не сжимается: итератор приложения (и wsgi.file_wrapper) отдаётся как есть
+            return app_iter
+        return self._compressed_body(app_iter, state)
+
+    @staticmethod
+    def _compressed_body(app_iter, state):
+        # Приложение-генератор вызывает start_response только при получении первой части тела
+        try:
+            compressor = None
+            for chunk in app_iter:
+                if compressor is None:
+                    compressor = state.get('compressor')
+                    if compressor is None:
+                        yield chunk
+                        yield from app_iter
+                        return
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            if compressor is None:
+                compressor = state.get('compressor')
+            if compressor is not None:
+                yield compressor.finish()
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                close()
+
+    def _should_compress(self, status, headers):
+        code = int(status.split(' ', 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+        if _header(headers, 'Content-Encoding'):
+            return False
+        if 'no-transform' in (_header(headers, 'Cache-Control') or ''):
+            return False
+        if not _compressible(_header(headers, 'Content-Type')):
+            return False
+        content_length = _header(headers, 'Content-Length')
+        return content_length is None or int(content_length) >= self.min_size
+
+    def _serve_static(self, environ, start_response, encoding):
+        """Сжатый статический файл из кэша на диске; None — файл отдаёт приложение"""
+        if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD') or environ.get('HTTP_RANGE'):
+            return None
+        filename = environ['PATH_INFO'][len(self.static_prefix):]
+        path = safe_join(self.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        content_type = mimetypes.guess_type(path)[0]
+        stat = os.stat(path)
+        if not _compressible(content_type) or stat.st_size < self.min_size:
+            return None
+
+        cached_path = self._cached_copy(path, stat, encoding)
+        if cached_path is None:
+            return None
+
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}-{encoding}"'
+        headers = [
+            ('Content-Type', f'{content_type}; charset=utf-8' if content_type.startswith('text/') or
+             content_type == 'application/javascript' else content_type),
+            ('Content-Encoding', encoding),
+            ('Vary', 'Accept-Encoding'),
+            ('ETag', etag),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+            ('Cache-Control', self.static_cache_control(filename)),
+        ]
+        if parse_etags(environ.get('HTTP_IF_NONE_MATCH')).contains_weak(etag.strip('"')):
+            start_response('304 Not Modified', headers)
+            return []
+
+        with open(cached_path, 'rb') as f:
+            body = f.read()
+        start_response('200 OK', headers + [('Content-Length', str(len(body)))])
+        return [] if environ['REQUEST_METHOD'] == 'HEAD' else [body]
+
+    def _cached_copy(self, path, stat, encoding):
+        """Путь к сжатой копии файла; копия пересоздаётся, если mtime исходного файла изменился"""
+        relative = os.path.relpath(path, self.static_folder)
+        cached_path = os.path.join(self.cache_dir, relative + CACHE_SUFFIXES[encoding])
+        try:
+            if os.stat(cached_path).st_mtime_ns == stat.st_mtime_ns:
+                return cached_path
+        except OSError:
+            pass
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            if encoding == 'br':
+                compressed = brotli.compress(data, quality=11)
+            else:
+                compressor = zlib.compressobj(9, zlib.DEFLATED, 31)
+                compressed = compressor.compress(data) + compressor.flush()
+
+            os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached_path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(compressed)
+            # mtime копии = mtime исходного файла: по нему проверяется актуальность
+            os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            os.replace(tmp_path, cached_path)
+            return cached_path
+        except OSError:
+            # Каталог кэша недоступен — файл отдаст приложение (со сжатием на лету)
+            return None
+
+
+def _header(headers, name):
+    name = name.lower()
+    for header, value in headers:
+        if header.lower() == name:
+            return value
+    return None
+
+
+def _add_vary(headers):
+    vary = _header(headers, 'Vary')
+    if vary and 'accept-encoding' in vary.lower():
+        return headers
+    headers = [(name, value) for name, value in headers if name.lower() != 'vary']
+    return headers + [('Vary', f'{vary}, Accept-Encoding' if vary else 'Accept-Encoding')]
@@ -37,19 +37,106 @@ class Config:
     
     # Telegram Bot Token (для проверки WebApp данных)
     TELEGRAM_BOT_TOKEN = read_secret('telegram_bot_token', os.getenv('TELEGRAM_BOT_TOKEN', ''))
+    # Кэш уже проверенных initData: размер (записей) и время жизни (секунды)
+    TELEGRAM_INIT_DATA_CACHE_SIZE = int(os.getenv('TELEGRAM_INIT_DATA_CACHE_SIZE', 1024))
+    TELEGRAM_INIT_DATA_CACHE_TTL = int(os.getenv('TELEGRAM_INIT_DATA_CACHE_TTL', 300))
     
+    # Интервал проверки изменений в таблице users для кэша авторизованных tg_id (секунды)
+    AUTHORIZED_USERS_REFRESH_INTERVAL = int(os.getenv('AUTHORIZED_USERS_REFRESH_INTERVAL', 30))
+
     # API Token для авторизации внешних сервисов
     API_TOKEN = read_secret('api_token', os.getenv('API_TOKEN', ''))
     
     # File upload settings
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
-    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf', 'doc', 'docx', 'txt'}
+    MAX_FILES = 5  # файлов в одной отправке формы
+    # Максимальный размер нефайловой части multipart (комментарий и т.п.)
+    MAX_FORM_MEMORY_SIZE = 512 * 1024
+    # Максимальный размер тела запроса: все файлы + поля формы и служебные данные multipart.
+    # Flask отклоняет больший запрос (413), запросы с известным Content-Length — до разбора тела.
+    # Тот же лимит задаётся на reverse proxy (client_max_body_size в nginx.conf.example)
+    MAX_CONTENT_LENGTH = MAX_FILES * MAX_FILE_SIZE + 1024 * 1024
+    # Загрузка по частям (сессии загрузки): рекомендуемый и максимальный размер части,
+    # время жизни незавершённой сессии (секунды)
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 2 * 1024 * 1024))
+    UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024))
+    UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 60 * 60))
+    ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'pdf', 'doc', 'docx', 'txt'}
+    # Фото уменьшаются в браузере перед загрузкой: максимальная сторона (пиксели, 0 — не уменьшать),
+    # качество (0-1) и формат (webp или jpeg; без кодировщика WebP в браузере — jpeg)
+    IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', 2048))
+    IMAGE_QUALITY = float(os.getenv('IMAGE_QUALITY', 0.82))
+    IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'webp')
     
     # SQLAlchemy settings
     SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Пул соединений веб-приложения (на процесс): постоянные соединения, дополнительные сверх них,
+    # пересоздание соединения старше DB_POOL_RECYCLE секунд, ожидание свободного соединения (секунды).
+    # При gunicorn соединений с MySQL до WEB_WORKERS * (DB_POOL_SIZE + DB_MAX_OVERFLOW) — учитывайте max_connections
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))
+    # Проверка соединения перед выдачей: always / idle / off (см. db_pool.py)
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'idle').lower()
+    DB_POOL_PRE_PING_IDLE = int(os.getenv('DB_POOL_PRE_PING_IDLE', 60))
+    # Получение соединения дольше порога (мс) пишется в лог
+    DB_POOL_SLOW_CHECKOUT_MS = int(os.getenv('DB_POOL_SLOW_CHECKOUT_MS', 100))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_pre_ping': DB_POOL_PRE_PING == 'always',
+    }
+
+    # Добавлять тестовые данные в пустые таблицы при flask init-db (по умолчанию нет)
+    SEED_TEST_DATA = os.getenv('SEED_TEST_DATA', 'False').lower() == 'true'
+
+    # Логирование: уровень, формат (json / text), размер очереди записей (при переполнении записи
+    # отбрасываются), доля выводимых частых INFO-записей (1 — все)
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+    LOG_INFO_SAMPLE_RATE = float(os.getenv('LOG_INFO_SAMPLE_RATE', 1.0))
+    # Запись о каждом запросе (метод, путь, статус, время) вместо синхронного access log gunicorn
+    ACCESS_LOG = os.getenv('ACCESS_LOG', 'True').lower() == 'true'
+
+    # SQL-запросы дольше порога (мс) пишутся в лог с именем endpoint (первые SLOW_QUERY_LOG_LENGTH символов)
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 200))
+    SLOW_QUERY_LOG_LENGTH = int(os.getenv('SLOW_QUERY_LOG_LENGTH', 1000))
+    # Заголовки X-DB-Query-Count и Server-Timing с числом и временем SQL-запросов в ответах (тесты, отладка)
+    SQL_TIMING_HEADER = os.getenv('SQL_TIMING_HEADER', 'False').lower() == 'true'
+
+    # Сжатие ответов (compression.py): минимальный размер ответа (байты), уровень gzip (1-9)
+    # и качество brotli (0-11) для динамических ответов, каталог сжатых копий статических файлов
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True').lower() == 'true'
+    COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+    COMPRESSION_LEVEL = int(os.getenv('COMPRESSION_LEVEL', 6))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+    COMPRESSION_CACHE_DIR = os.getenv('COMPRESSION_CACHE_DIR', '/tmp/miniapp-static-cache')
+
+    # Время жизни in-process кэша справочников (секунды), 0 — без ограничения
+    REFERENCE_CACHE_TTL = int(os.getenv('REFERENCE_CACHE_TTL', 300))
+
+    # Production WSGI-сервер (gunicorn.conf.py): адрес, число процессов и потоков в каждом,
+    # keep-alive, тайм-аут запроса и плавной остановки воркера (секунды),
+    # перезапуск воркера после WEB_MAX_REQUESTS запросов (0 — не перезапускать; по умолчанию выключен:
+    # файлы метрик каждого завершённого воркера остаются в PROMETHEUS_MULTIPROC_DIR до перезапуска сервера)
+    WEB_BIND = os.getenv('WEB_BIND', '0.0.0.0:5000')
+    WEB_WORKERS = int(os.getenv('WEB_WORKERS', 0)) or (os.cpu_count() or 1) * 2 + 1
+    WEB_THREADS = int(os.getenv('WEB_THREADS', 4))
+    WEB_KEEPALIVE = int(os.getenv('WEB_KEEPALIVE', 5))
+    WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', 120))
+    WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+    WEB_MAX_REQUESTS = int(os.getenv('WEB_MAX_REQUESTS', 0))
+    WEB_MAX_REQUESTS_JITTER = int(os.getenv('WEB_MAX_REQUESTS_JITTER', 100))
+    # Каталог, через который воркеры gunicorn объединяют метрики Prometheus (очищается при старте)
+    PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', '/tmp/miniapp-metrics')
+
     # Префикс приложения (для работы за /form и т.п.)
     # Устанавливается через переменную окружения APPLICATION_ROOT
     APPLICATION_ROOT = os.getenv('APPLICATION_ROOT', None)
@@ -1,158 +1,236 @@
 import time
+from contextlib import contextmanager
 from flask_sqlalchemy import SQLAlchemy
 from flask import Flask
 from sqlalchemy import text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from config import Config
+from db_pool import engine_options, install_idle_pre_ping
+from sql_monitor import install_query_monitor
 
 db = SQLAlchemy()
 
 
 def init_db(app: Flask):
-    """Инициализация базы данных"""
+    """Подключение SQLAlchemy к приложению (без обращения к БД: соединения открываются при первом запросе)"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
     db.init_app(app)
-    
+
     with app.app_context():
-        # Ожидание готовности БД (для Docker)
-        max_retries = 30
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                # Проверка подключения к БД
-                db.engine.connect()
-                # Создание всех таблиц
-                db.create_all()
-                
-                # Проверка и добавление недостающих колонок btxid
-                _add_missing_btxid_columns()
-                # Добавление колонки state в objects при необходимости
-                _add_missing_object_state_column()
-                # Добавление колонки state в violations при необходимости
-                _add_missing_violation_state_column()
-                # Увеличение размера file_path в form_submissions при необходимости
-                _ensure_file_path_text()
-                # form_submissions.city_id: привязка к cities.btxid вместо cities.id
-                _migrate_form_submissions_city_to_btxid()
-                # form_submissions.object_id, violation_category_id, violation_id: привязка к *.btxid вместо *.id
-                _migrate_form_submissions_object_category_violation_to_btxid()
-                
-                break
-            except Exception as e:
-                retry_count += 1
-                if retry_count >= max_retries:
-                    raise Exception(f"Не удалось подключиться к базе данных после {max_retries} попыток: {e}")
-                time.sleep(2)
+        if Config.DB_POOL_PRE_PING == 'idle':
+            install_idle_pre_ping(db.engine, Config.DB_POOL_PRE_PING_IDLE)
+        install_query_monitor(db.engine)
+
+
+def setup_database(seed=False):
+    """
+    Подготовка БД (команда flask init-db): ожидание готовности, миграции и, по запросу, тестовые данные.
+    Вызывается в контексте приложения.
+    """
+    # Ожидание готовности БД (для Docker)
+    max_retries = 30
+    retry_count = 0
+    while retry_count < max_retries:
+        try:
+            # Проверка подключения к БД (соединение сразу возвращается в пул)
+            with db.engine.connect():
+                pass
+            # Создание таблиц и миграции, которые ещё не применялись
+            migrate()
+            break
+        except Exception as e:
+            retry_count += 1
+            if retry_count >= max_retries:
+                raise Exception(f"Не удалось подключиться к базе данных после {max_retries} попыток: {e}")
+            time.sleep(2)
+
+    if seed:
+        seed_test_data()
+
+
+def seed_test_data():
+    """Добавление тестовых данных, если таблицы пустые"""
+    from models import City, Object, ViolationCategory, Violation, User
+    
+    if City.query.count() == 0:
+        # Добавляем тестовые города
+        cities_data = [
+            {'name': 'Москва'},
+            {'name': 'Санкт-Петербург'},
+            {'name': 'Новосибирск'}
+        ]
+        for city_data in cities_data:
+            city = City(**city_data)
+            db.session.add(city)
+        
+        db.session.commit()
+        
+        # Добавляем тестовые объекты
+        moscow = City.query.filter_by(name='Москва').first()
+        spb = City.query.filter_by(name='Санкт-Петербург').first()
         
-        # Добавление тестовых данных, если таблицы пустые
-        from models import City, Object, ViolationCategory, Violation, User
+        objects_data = [
+            {'city_id': moscow.id, 'name': 'Объект 1 в Москве'},
+            {'city_id': moscow.id, 'name': 'Объект 2 в Москве'},
+            {'city_id': spb.id, 'name': 'Объект 1 в СПб'},
+            {'city_id': spb.id, 'name': 'Объект 2 в СПб'}
+        ]
+        for obj_data in objects_data:
+            obj = Object(**obj_data)
+            db.session.add(obj)
+        
+        db.session.commit()
+    
+    if ViolationCategory.query.count() == 0:
+        # Добавляем тестовые категории нарушений
+        categories_data = [
+            {'name': 'Безопасность'},
+            {'name': 'Санитария'},
+            {'name': 'Пожарная безопасность'}
+        ]
+        for cat_data in categories_data:
+            category = ViolationCategory(**cat_data)
+            db.session.add(category)
         
-        if City.query.count() == 0:
-            # Добавляем тестовые города
-            cities_data = [
-                {'name': 'Москва'},
-                {'name': 'Санкт-Петербург'},
-                {'name': 'Новосибирск'}
-            ]
-            for city_data in cities_data:
-                city = City(**city_data)
-                db.session.add(city)
-            
-            db.session.commit()
-            
-            # Добавляем тестовые объекты
-            moscow = City.query.filter_by(name='Москва').first()
-            spb = City.query.filter_by(name='Санкт-Петербург').first()
-            
-            objects_data = [
-                {'city_id': moscow.id, 'name': 'Объект 1 в Москве'},
-                {'city_id': moscow.id, 'name': 'Объект 2 в Москве'},
-                {'city_id': spb.id, 'name': 'Объект 1 в СПб'},
-                {'city_id': spb.id, 'name': 'Объект 2 в СПб'}
-            ]
-            for obj_data in objects_data:
-                obj = Object(**obj_data)
-                db.session.add(obj)
-            
-            db.session.commit()
+        db.session.commit()
         
-        if ViolationCategory.query.count() == 0:
-            # Добавляем тестовые категории нарушений
-            categories_data = [
-                {'name': 'Безопасность'},
-                {'name': 'Санитария'},
-                {'name': 'Пожарная безопасность'}
-            ]
-            for cat_data in categories_data:
-                category = ViolationCategory(**cat_data)
-                db.session.add(category)
-            
-            db.session.commit()
-            
-            # Добавляем тестовые нарушения
-            safety = ViolationCategory.query.filter_by(name='Безопасность').first()
-            sanitation = ViolationCategory.query.filter_by(name='Санитария').first()
-            
-            violations_data = [
-                {'category_id': safety.id, 'name': 'Отсутствие ограждения'},
-                {'category_id': safety.id, 'name': 'Неисправное освещение'},
-                {'category_id': sanitation.id, 'name': 'Загрязнение территории'},
-                {'category_id': sanitation.id, 'name': 'Отсутствие урн'}
-            ]
-            for viol_data in violations_data:
-                violation = Violation(**viol_data)
-                db.session.add(violation)
-
-            db.session.commit()
-
-        if User.query.count() == 0:
-            # Добавляем тестовых пользователей
-            users_data = [
-                {'first_name': 'Иван', 'last_name': 'Иванов', 'tg_id': 123456789, 'secret_key': User.generate_secret_key()},
-                {'first_name': 'Мария', 'last_name': 'Петрова', 'tg_id': 987654321, 'secret_key': User.generate_secret_key()},
-                {'first_name': 'Алексей', 'last_name': 'Сидоров', 'tg_id': 555123456, 'secret_key': User.generate_secret_key()}
-            ]
-            for user_data in users_data:
-                user = User(**user_data)
-                db.session.add(user)
-
-            db.session.commit()
+        # Добавляем тестовые нарушения
+        safety = ViolationCategory.query.filter_by(name='Безопасность').first()
+        sanitation = ViolationCategory.query.filter_by(name='Санитария').first()
+        
+        violations_data = [
+            {'category_id': safety.id, 'name': 'Отсутствие ограждения'},
+            {'category_id': safety.id, 'name': 'Неисправное освещение'},
+            {'category_id': sanitation.id, 'name': 'Загрязнение территории'},
+            {'category_id': sanitation.id, 'name': 'Отсутствие урн'}
+        ]
+        for viol_data in violations_data:
+            violation = Violation(**viol_data)
+            db.session.add(violation)
+
+        db.session.commit()
+
+    if User.query.count() == 0:
+        # Добавляем тестовых пользователей
+        users_data = [
+            {'first_name': 'Иван', 'last_name': 'Иванов', 'tg_id': 123456789, 'secret_key': User.generate_secret_key()},
+            {'first_name': 'Мария', 'last_name': 'Петрова', 'tg_id': 987654321, 'secret_key': User.generate_secret_key()},
+            {'first_name': 'Алексей', 'last_name': 'Сидоров', 'tg_id': 555123456, 'secret_key': User.generate_secret_key()}
+        ]
+        for user_data in users_data:
+            user = User(**user_data)
+            db.session.add(user)
+
+        db.session.commit()
+
+
+# Имя блокировки MySQL (GET_LOCK), под которой миграции выполняет только один процесс
+MIGRATION_LOCK_NAME = 'telegram_miniapp_schema_migrations'
+MIGRATION_LOCK_TIMEOUT = 300
+
+
+def get_schema_version():
+    """Текущая версия схемы из таблицы schema_version (0 — таблицы ещё нет или миграции не применялись)"""
+    try:
+        with db.engine.connect() as conn:
+            version = conn.execute(text("SELECT version FROM schema_version WHERE id = 1")).scalar()
+    except (ProgrammingError, OperationalError):
+        return 0
+    return version or 0
+
+
+def _set_schema_version(version):
+    from models import SchemaVersion
+
+    row = db.session.get(SchemaVersion, 1)
+    if row is None:
+        db.session.add(SchemaVersion(id=1, version=version))
+    else:
+        row.version = version
+    db.session.commit()
+
+
+@contextmanager
+def _migration_lock():
+    """Межпроцессная блокировка на время миграций (несколько воркеров/контейнеров при rolling restart)"""
+    if db.engine.dialect.name != 'mysql':
+        yield
+        return
+
+    with db.engine.connect() as conn:
+        acquired = conn.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"),
+            {"name": MIGRATION_LOCK_NAME, "timeout": MIGRATION_LOCK_TIMEOUT}
+        ).scalar()
+        if acquired != 1:
+            raise Exception(f"Не удалось получить блокировку миграций за {MIGRATION_LOCK_TIMEOUT} с")
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK_NAME})
+
+
+def migrate():
+    """
+    Применение шагов MIGRATIONS, которые ещё не применялись.
+
+    При актуальной схеме выполняется один запрос к schema_version; иначе шаги
+    выполняются по порядку под блокировкой, версия сохраняется после каждого шага.
+    Ошибка шага (блокировка, обрыв соединения во время ALTER TABLE) прерывает
+    миграцию без записи версии: шаг повторится при следующем запуске.
+    """
+    latest_version = MIGRATIONS[-1][0]
+    if get_schema_version() >= latest_version:
+        return
+
+    with _migration_lock():
+        # Пока ждали блокировку, миграции мог выполнить другой процесс
+        current_version = get_schema_version()
+        for version, description, step in MIGRATIONS:
+            if version <= current_version:
+                continue
+            # Шаги после create_all дорабатывают MySQL-схему старых версий (information_schema);
+            # на других СУБД схему целиком создаёт create_all
+            if version == 1 or db.engine.dialect.name == 'mysql':
+                step()
+            _set_schema_version(version)
+            print(f"Applied migration {version}: {description}")
 
 
 def _add_missing_btxid_columns():
     """Добавление недостающих колонок btxid в существующие таблицы"""
-    try:
-        # Список таблиц и колонок для проверки
-        tables_to_check = [
-            ('cities', 'name'),
-            ('objects', 'name'),
-            ('violation_categories', 'name'),
-            ('violations', 'name'),
-            ('users', 'secret_key')
-        ]
+    # Список таблиц и колонок для проверки
+    tables_to_check = [
+        ('cities', 'name'),
+        ('objects', 'name'),
+        ('violation_categories', 'name'),
+        ('violations', 'name'),
+        ('users', 'secret_key')
+    ]
         
-        for table_name, after_column in tables_to_check:
-            try:
-                # Проверяем существование колонки btxid
-                with db.engine.connect() as conn:
-                    result = conn.execute(text(
-                        f"SELECT COUNT(*) as cnt FROM information_schema.COLUMNS "
-                        f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table_name}' AND COLUMN_NAME = 'btxid'"
-                    ))
-                    column_exists = result.fetchone()[0] > 0
+    for table_name, after_column in tables_to_check:
+        try:
+            # Проверяем существование колонки btxid
+            with db.engine.connect() as conn:
+                result = conn.execute(text(
+                    f"SELECT COUNT(*) as cnt FROM information_schema.COLUMNS "
+                    f"WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = '{table_name}' AND COLUMN_NAME = 'btxid'"
+                ))
+                column_exists = result.fetchone()[0] > 0
                     
-                    if not column_exists:
-                        # Добавляем колонку btxid
-                        conn.execute(text(
-                            f"ALTER TABLE {table_name} ADD COLUMN btxid INT NULL DEFAULT NULL AFTER {after_column}"
-                        ))
-                        conn.commit()
-                        print(f"Added btxid column to {table_name}")
-            except Exception as e:
-                # Игнорируем ошибки, если колонка уже существует или таблица не существует
-                error_msg = str(e)
-                if 'Duplicate column name' not in error_msg and "doesn't exist" not in error_msg:
-                    print(f"Warning: Could not add btxid to {table_name}: {e}")
-    except Exception as e:
-        # Игнорируем ошибки миграции, чтобы не блокировать запуск приложения
-        print(f"Warning: Could not check/add btxid columns: {e}")
+                if not column_exists:
+                    # Добавляем колонку btxid
+                    conn.execute(text(
+                        f"ALTER TABLE {table_name} ADD COLUMN btxid INT NULL DEFAULT NULL AFTER {after_column}"
+                    ))
+                    conn.commit()
+                    print(f"Added btxid column to {table_name}")
+        except Exception as e:
+            # Колонка уже существует или таблицы нет — делать нечего; иначе шаг не применён
+            error_msg = str(e)
+            if 'Duplicate column name' not in error_msg and "doesn't exist" not in error_msg:
+                raise
 
 
 def _add_missing_object_state_column():
@@ -173,7 +251,7 @@ def _add_missing_object_state_column():
     except Exception as e:
         error_msg = str(e)
         if 'Duplicate column name' not in error_msg and "doesn't exist" not in error_msg:
-            print(f"Warning: Could not add state column to objects: {e}")
+            raise
 
 
 def _add_missing_violation_state_column():
@@ -194,133 +272,215 @@ def _add_missing_violation_state_column():
     except Exception as e:
         error_msg = str(e)
         if 'Duplicate column name' not in error_msg and "doesn't exist" not in error_msg:
-            print(f"Warning: Could not add state column to violations: {e}")
+            raise
 
 
 def _ensure_file_path_text():
     """Увеличение размера file_path в form_submissions до TEXT при необходимости"""
+    with db.engine.connect() as conn:
+        result = conn.execute(text(
+            "SELECT DATA_TYPE FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'form_submissions' AND COLUMN_NAME = 'file_path'"
+        ))
+        row = result.fetchone()
+        if not row:
+            return
+
+        data_type = (row[0] or '').lower()
+        if data_type not in ('text', 'mediumtext', 'longtext'):
+            conn.execute(text(
+                "ALTER TABLE form_submissions MODIFY COLUMN file_path TEXT NULL"
+            ))
+            conn.commit()
+            print("Updated form_submissions.file_path to TEXT")
+
+
+def _add_missing_index(table_name, index_name, columns):
+    """Создание индекса в существующей таблице при отсутствии (create_all не добавляет индексы)"""
     try:
         with db.engine.connect() as conn:
             result = conn.execute(text(
-                "SELECT DATA_TYPE FROM information_schema.COLUMNS "
-                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'form_submissions' AND COLUMN_NAME = 'file_path'"
-            ))
-            row = result.fetchone()
-            if not row:
+                "SELECT COUNT(*) FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tbl AND INDEX_NAME = :idx"
+            ), {"tbl": table_name, "idx": index_name})
+            if result.fetchone()[0] > 0:
                 return
-
-            data_type = (row[0] or '').lower()
-            if data_type not in ('text', 'mediumtext', 'longtext'):
-                conn.execute(text(
-                    "ALTER TABLE form_submissions MODIFY COLUMN file_path TEXT NULL"
-                ))
-                conn.commit()
-                print("Updated form_submissions.file_path to TEXT")
+            conn.execute(text(
+                f"CREATE INDEX {index_name} ON {table_name} ({', '.join(columns)})"
+            ))
+            conn.commit()
+            print(f"Added index {index_name} to {table_name}")
     except Exception as e:
-        # Игнорируем ошибки миграции, чтобы не блокировать запуск приложения
-        print(f"Warning: Could not update file_path column type: {e}")
+        error_msg = str(e)
+        if 'Duplicate key name' not in error_msg and "doesn't exist" not in error_msg:
+            raise
 
 
 def _migrate_form_submissions_city_to_btxid():
     """Перевод form_submissions.city_id с ссылки на cities.id на cities.btxid."""
-    try:
+    with db.engine.connect() as conn:
+        # Проверяем, что FK ещё ссылается на cities.id (миграция не выполнялась)
+        r = conn.execute(text(
+            "SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'form_submissions' "
+            "AND COLUMN_NAME = 'city_id' AND REFERENCED_TABLE_NAME = 'cities' AND REFERENCED_COLUMN_NAME = 'id'"
+        ))
+        row = r.fetchone()
+        if not row:
+            # Уже мигрировано или другой вариант схемы
+            return
+        fk_name = row[0]
+
+        # Уникальный индекс на cities.btxid (для FK)
+        r2 = conn.execute(text(
+            "SELECT COUNT(*) FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'cities' AND COLUMN_NAME = 'btxid' AND NON_UNIQUE = 0"
+        ))
+        if r2.fetchone()[0] == 0:
+            conn.execute(text("ALTER TABLE cities ADD UNIQUE INDEX cities_btxid_unique (btxid)"))
+            conn.commit()
+
+        # Разрешить NULL в city_id (для городов без btxid)
+        conn.execute(text("ALTER TABLE form_submissions MODIFY COLUMN city_id INT NULL"))
+        conn.commit()
+
+        # Обновить значения: city_id = btxid города (где city_id раньше был id)
+        conn.execute(text(
+            "UPDATE form_submissions fs "
+            "INNER JOIN cities c ON c.id = fs.city_id "
+            "SET fs.city_id = c.btxid"
+        ))
+        conn.commit()
+
+        # Удалить старый FK
+        conn.execute(text(f"ALTER TABLE form_submissions DROP FOREIGN KEY `{fk_name}`"))
+        conn.commit()
+
+        # Добавить новый FK на cities.btxid
+        conn.execute(text(
+            "ALTER TABLE form_submissions ADD CONSTRAINT form_submissions_city_btxid_fk "
+            "FOREIGN KEY (city_id) REFERENCES cities(btxid) ON DELETE RESTRICT"
+        ))
+        conn.commit()
+        print("Migrated form_submissions.city_id to reference cities.btxid")
+
+
+def _migrate_form_submissions_object_category_violation_to_btxid():
+    """Перевод form_submissions.object_id, violation_category_id, violation_id на ссылки на *.btxid."""
+    refs = [
+        ('object_id', 'objects', 'objects_btxid_unique', 'form_submissions_object_btxid_fk'),
+        ('violation_category_id', 'violation_categories', 'violation_categories_btxid_unique', 'form_submissions_violation_category_btxid_fk'),
+        ('violation_id', 'violations', 'violations_btxid_unique', 'form_submissions_violation_btxid_fk'),
+    ]
+    for col, table, unique_idx, new_fk_name in refs:
         with db.engine.connect() as conn:
-            # Проверяем, что FK ещё ссылается на cities.id (миграция не выполнялась)
             r = conn.execute(text(
                 "SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
                 "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'form_submissions' "
-                "AND COLUMN_NAME = 'city_id' AND REFERENCED_TABLE_NAME = 'cities' AND REFERENCED_COLUMN_NAME = 'id'"
-            ))
+                "AND COLUMN_NAME = :col AND REFERENCED_TABLE_NAME = :tbl AND REFERENCED_COLUMN_NAME = 'id'"
+            ), {"col": col, "tbl": table})
             row = r.fetchone()
             if not row:
-                # Уже мигрировано или другой вариант схемы
-                return
+                continue
             fk_name = row[0]
 
-            # Уникальный индекс на cities.btxid (для FK)
+            # Уникальный индекс на ref.btxid
             r2 = conn.execute(text(
                 "SELECT COUNT(*) FROM information_schema.STATISTICS "
-                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'cities' AND COLUMN_NAME = 'btxid' AND NON_UNIQUE = 0"
-            ))
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tbl AND COLUMN_NAME = 'btxid' AND NON_UNIQUE = 0"
+            ), {"tbl": table})
             if r2.fetchone()[0] == 0:
-                conn.execute(text("ALTER TABLE cities ADD UNIQUE INDEX cities_btxid_unique (btxid)"))
+                conn.execute(text(f"ALTER TABLE {table} ADD UNIQUE INDEX {unique_idx} (btxid)"))
                 conn.commit()
 
-            # Разрешить NULL в city_id (для городов без btxid)
-            conn.execute(text("ALTER TABLE form_submissions MODIFY COLUMN city_id INT NULL"))
+            conn.execute(text(f"ALTER TABLE form_submissions MODIFY COLUMN {col} INT NULL"))
             conn.commit()
 
-            # Обновить значения: city_id = btxid города (где city_id раньше был id)
+            # UPDATE: col = btxid из ref по текущему id
             conn.execute(text(
-                "UPDATE form_submissions fs "
-                "INNER JOIN cities c ON c.id = fs.city_id "
-                "SET fs.city_id = c.btxid"
+                f"UPDATE form_submissions fs "
+                f"INNER JOIN {table} r ON r.id = fs.{col} "
+                f"SET fs.{col} = r.btxid"
             ))
             conn.commit()
 
-            # Удалить старый FK
             conn.execute(text(f"ALTER TABLE form_submissions DROP FOREIGN KEY `{fk_name}`"))
             conn.commit()
 
-            # Добавить новый FK на cities.btxid
             conn.execute(text(
-                "ALTER TABLE form_submissions ADD CONSTRAINT form_submissions_city_btxid_fk "
-                "FOREIGN KEY (city_id) REFERENCES cities(btxid) ON DELETE RESTRICT"
+                f"ALTER TABLE form_submissions ADD CONSTRAINT {new_fk_name} "
+                f"FOREIGN KEY ({col}) REFERENCES {table}(btxid) ON DELETE RESTRICT"
             ))
             conn.commit()
-            print("Migrated form_submissions.city_id to reference cities.btxid")
-    except Exception as e:
-        print(f"Warning: Could not migrate form_submissions.city_id to btxid: {e}")
+            print(f"Migrated form_submissions.{col} to reference {table}.btxid")
 
 
-def _migrate_form_submissions_object_category_violation_to_btxid():
-    """Перевод form_submissions.object_id, violation_category_id, violation_id на ссылки на *.btxid."""
-    refs = [
-        ('object_id', 'objects', 'objects_btxid_unique', 'form_submissions_object_btxid_fk'),
-        ('violation_category_id', 'violation_categories', 'violation_categories_btxid_unique', 'form_submissions_violation_category_btxid_fk'),
-        ('violation_id', 'violations', 'violations_btxid_unique', 'form_submissions_violation_btxid_fk'),
-    ]
-    for col, table, unique_idx, new_fk_name in refs:
-        try:
-            with db.engine.connect() as conn:
-                r = conn.execute(text(
-                    "SELECT CONSTRAINT_NAME FROM information_schema.KEY_COLUMN_USAGE "
-                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'form_submissions' "
-                    "AND COLUMN_NAME = :col AND REFERENCED_TABLE_NAME = :tbl AND REFERENCED_COLUMN_NAME = 'id'"
-                ), {"col": col, "tbl": table})
-                row = r.fetchone()
-                if not row:
-                    continue
-                fk_name = row[0]
-
-                # Уникальный индекс на ref.btxid
-                r2 = conn.execute(text(
-                    "SELECT COUNT(*) FROM information_schema.STATISTICS "
-                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tbl AND COLUMN_NAME = 'btxid' AND NON_UNIQUE = 0"
-                ), {"tbl": table})
-                if r2.fetchone()[0] == 0:
-                    conn.execute(text(f"ALTER TABLE {table} ADD UNIQUE INDEX {unique_idx} (btxid)"))
-                    conn.commit()
+def check_indexes():
+    """
+    EXPLAIN горячих запросов (команда flask check-indexes, только MySQL).
 
-                conn.execute(text(f"ALTER TABLE form_submissions MODIFY COLUMN {col} INT NULL"))
-                conn.commit()
+    Returns:
+        Список (запрос, ожидаемый индекс, строка EXPLAIN, ok): ok — запрос использует
+        ожидаемый индекс и обходится без filesort
+    """
+    from sqlalchemy import select
+    from models import Object, Violation, FormSubmission
 
-                # UPDATE: col = btxid из ref по текущему id
-                conn.execute(text(
-                    f"UPDATE form_submissions fs "
-                    f"INNER JOIN {table} r ON r.id = fs.{col} "
-                    f"SET fs.{col} = r.btxid"
-                ))
-                conn.commit()
+    hot_queries = [
+        ('objects of a city',
+         select(Object.id, Object.name, Object.btxid, Object.state)
+         .where(Object.city_id == 1).order_by(Object.name),
+         'ix_objects_city_id_name'),
+        ('objects for reference cache',
+         select(Object.id, Object.city_id, Object.name, Object.btxid, Object.state)
+         .order_by(Object.city_id, Object.name),
+         'ix_objects_city_id_name'),
+        ('violations of a category',
+         select(Violation.id, Violation.name, Violation.btxid, Violation.state)
+         .where(Violation.category_id == 1).order_by(Violation.name),
+         'ix_violations_category_id_name'),
+        ('violations for reference cache',
+         select(Violation.id, Violation.category_id, Violation.name, Violation.btxid, Violation.state)
+         .order_by(Violation.category_id, Violation.name),
+         'ix_violations_category_id_name'),
+        ('submissions page',
+         select(FormSubmission.id)
+         .order_by(FormSubmission.created_at.desc(), FormSubmission.id.desc()).limit(50),
+         'ix_form_submissions_created_at_id'),
+        ('submissions of a telegram user',
+         select(FormSubmission.id).where(FormSubmission.telegram_user_id == 1)
+         .order_by(FormSubmission.created_at.desc(), FormSubmission.id.desc()).limit(50),
+         'ix_form_submissions_telegram_user_id_created_at'),
+    ]
 
-                conn.execute(text(f"ALTER TABLE form_submissions DROP FOREIGN KEY `{fk_name}`"))
-                conn.commit()
+    results = []
+    with db.engine.connect() as conn:
+        for name, stmt, index_name in hot_queries:
+            sql = stmt.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+            plan = dict(conn.execute(text(f"EXPLAIN {sql}")).mappings().first())
+            ok = plan.get('key') == index_name and 'filesort' not in (plan.get('Extra') or '')
+            results.append((name, index_name, plan, ok))
+    return results
 
-                conn.execute(text(
-                    f"ALTER TABLE form_submissions ADD CONSTRAINT {new_fk_name} "
-                    f"FOREIGN KEY ({col}) REFERENCES {table}(btxid) ON DELETE RESTRICT"
-                ))
-                conn.commit()
-                print(f"Migrated form_submissions.{col} to reference {table}.btxid")
-        except Exception as e:
-            print(f"Warning: Could not migrate form_submissions.{col} to btxid: {e}")
+
+# Шаги миграции схемы: (версия, описание, функция). Порядок и номера версий не меняются,
+# новые шаги добавляются в конец. Каждый шаг идемпотентен: повторный запуск ничего не ломает.
+MIGRATIONS = [
+    (1, 'create tables', db.create_all),
+    (2, 'add btxid columns', _add_missing_btxid_columns),
+    (3, 'add objects.state', _add_missing_object_state_column),
+    (4, 'add violations.state', _add_missing_violation_state_column),
+    (5, 'form_submissions.file_path as TEXT', _ensure_file_path_text),
+    (6, 'form_submissions.city_id references cities.btxid', _migrate_form_submissions_city_to_btxid),
+    (7, 'form_submissions object/category/violation reference btxid', _migrate_form_submissions_object_category_violation_to_btxid),
+    (8, 'index form_submissions (created_at, id)',
+     lambda: _add_missing_index('form_submissions', 'ix_form_submissions_created_at_id', ['created_at', 'id'])),
+    (9, 'index objects (city_id, name, btxid, state)',
+     lambda: _add_missing_index('objects', 'ix_objects_city_id_name', ['city_id', 'name', 'btxid', 'state'])),
+    (10, 'index violations (category_id, name, btxid, state)',
+     lambda: _add_missing_index('violations', 'ix_violations_category_id_name', ['category_id', 'name', 'btxid', 'state'])),
+    (11, 'index form_submissions (telegram_user_id, created_at)',
+     lambda: _add_missing_index(
+         'form_submissions', 'ix_form_submissions_telegram_user_id_created_at', ['telegram_user_id', 'created_at']
+     )),
+]
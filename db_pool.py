@@ -0,0 +1,152 @@
+"""
+Пул соединений с БД веб-приложения.
+
+Параметры пула задаются в Config (переменные окружения DB_POOL_*). Пул
+замеряет время получения соединения: ожидание дольше DB_POOL_SLOW_CHECKOUT_MS
+и исчерпание пула (pool_timeout) пишутся в лог вместе с заполненностью пула,
+накопленная статистика доступна через pool_stats.snapshot() и в метриках
+db_pool_* (metrics.py).
+
+Стратегии проверки соединения перед выдачей (DB_POOL_PRE_PING):
+- always — pool_pre_ping SQLAlchemy, ping при каждом получении соединения;
+- idle — ping только если соединение простаивало в пуле дольше
+  DB_POOL_PRE_PING_IDLE секунд (активные соединения не платят лишний round trip);
+- off — без проверки, полагаемся на pool_recycle.
+"""
+import logging
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+from config import Config
+from metrics import (
+    DB_POOL_CAPACITY, DB_POOL_CHECKOUT_DURATION, DB_POOL_CHECKOUT_TIMEOUTS, DB_POOL_CONNECTIONS_IN_USE
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolStats:
+    """Счётчики получения соединений из пула (на процесс)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = None
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_checkout(self, pool, waited):
+        slow = waited * 1000 >= Config.DB_POOL_SLOW_CHECKOUT_MS
+        DB_POOL_CHECKOUT_DURATION.observe(waited)
+        DB_POOL_CONNECTIONS_IN_USE.inc()
+        with self._lock:
+            self._pool = pool
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            if slow:
+                self.slow_checkouts += 1
+        if not slow:
+            return
+        logger.warning(
+            "slow checkout %.1f ms (checked out %s of %s)",
+            waited * 1000, pool.checkedout(), pool_capacity(pool)
+        )
+
+    def record_timeout(self, pool, waited):
+        DB_POOL_CHECKOUT_TIMEOUTS.inc()
+        with self._lock:
+            self._pool = pool
+            self.timeouts += 1
+        logger.error(
+            "no connection available after %.1f s (checked out %s of %s)",
+            waited, pool.checkedout(), pool_capacity(pool)
+        )
+
+    def snapshot(self):
+        """Текущее состояние пула и накопленные счётчики"""
+        with self._lock:
+            pool = self._pool
+            stats = {
+                'checkouts': self.checkouts,
+                'slow_checkouts': self.slow_checkouts,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_seconds_total, 6),
+                'wait_seconds_max': round(self.wait_seconds_max, 6),
+            }
+        if pool is not None:
+            capacity = pool_capacity(pool)
+            stats.update({
+                'size': pool.size(),
+                'capacity': capacity,
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': max(pool.overflow(), 0),
+                'saturation': round(pool.checkedout() / capacity, 3) if capacity else None,
+            })
+        return stats
+
+
+pool_stats = PoolStats()
+
+
+def pool_capacity(pool):
+    """Максимум одновременно выданных соединений: pool_size + max_overflow (None — без ограничения)"""
+    if pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, замеряющий время получения соединения"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        capacity = pool_capacity(self)
+        if capacity is not None:
+            DB_POOL_CAPACITY.set(capacity)
+
+    def _do_return_conn(self, record):
+        DB_POOL_CONNECTIONS_IN_USE.dec()
+        super()._do_return_conn(record)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.record_timeout(self, time.perf_counter() - started)
+            raise
+        pool_stats.record_checkout(self, time.perf_counter() - started)
+        return connection
+
+
+def engine_options(options):
+    """SQLALCHEMY_ENGINE_OPTIONS с инструментированным пулом (для драйверов, работающих через QueuePool)"""
+    return {'poolclass': InstrumentedQueuePool, **options}
+
+
+def install_idle_pre_ping(engine, idle_seconds):
+    """Проверять соединение перед выдачей, только если оно простаивало дольше idle_seconds"""
+
+    @event.listens_for(engine, 'checkin')
+    def _remember_checkin(dbapi_connection, connection_record):
+        connection_record.info['checked_in_at'] = time.monotonic()
+
+    @event.listens_for(engine, 'checkout')
+    def _ping_idle_connection(dbapi_connection, connection_record, connection_proxy):
+        checked_in_at = connection_record.info.get('checked_in_at')
+        if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+            return
+        try:
+            alive = engine.dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            raise exc.DisconnectionError(str(e)) from e
+        if not alive:
+            # Пул закроет соединение и повторит попытку с новым
+            raise exc.DisconnectionError('Connection is no longer alive')
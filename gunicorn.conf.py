@@ -0,0 +1,57 @@
+"""
+Конфигурация gunicorn (production).
+
+Параметры берутся из Config (переменные окружения WEB_*). Каждый воркер
+импортирует приложение сам (импорт не обращается к БД: миграции выполняет
+flask --app app init-db перед запуском сервера) и после загрузки прогревает
+собственные in-process кэши.
+
+Плавный перезапуск: kill -HUP <master pid> — воркеры перезапускаются с новым
+кодом, незавершённые запросы дорабатываются в пределах WEB_GRACEFUL_TIMEOUT.
+"""
+import os
+import shutil
+
+from config import Config
+
+# Метрики воркеров пишутся в общий каталог (см. metrics.py); переменная окружения
+# должна быть задана до импорта prometheus_client в воркерах
+os.environ['PROMETHEUS_MULTIPROC_DIR'] = Config.PROMETHEUS_MULTIPROC_DIR
+
+bind = Config.WEB_BIND
+workers = Config.WEB_WORKERS
+# Потоки внутри воркера: медленная загрузка файла с телефона не занимает весь процесс
+worker_class = 'gthread'
+threads = Config.WEB_THREADS
+keepalive = Config.WEB_KEEPALIVE
+timeout = Config.WEB_TIMEOUT
+graceful_timeout = Config.WEB_GRACEFUL_TIMEOUT
+# По умолчанию 0: каждый перезапущенный воркер оставляет свои файлы метрик до перезапуска сервера
+max_requests = Config.WEB_MAX_REQUESTS
+max_requests_jitter = Config.WEB_MAX_REQUESTS_JITTER
+
+# Access log gunicorn пишется синхронно в потоке запроса и текстом: запись о запросе
+# выводит приложение через очередь логов (ACCESS_LOG, logging_setup.py). errorlog —
+# сообщения мастера; в воркере gunicorn.error передаётся в очередь приложения
+accesslog = None
+errorlog = '-'
+
+
+def on_starting(server):
+    """Очистка метрик предыдущего запуска сервера"""
+    shutil.rmtree(Config.PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(Config.PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Метрики-gauge завершившегося воркера больше не учитываются"""
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def post_worker_init(worker):
+    """Инициализация воркера после загрузки приложения"""
+    from app import warm_caches
+
+    warm_caches(worker.wsgi)
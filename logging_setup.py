@@ -0,0 +1,144 @@
+"""
+Логирование веб-приложения без блокировки обработки запросов.
+
+Корневой логгер пишет записи в очередь (QueueHandler), а форматирование и вывод
+в stderr выполняет отдельный поток QueueListener. Поэтому:
+- сообщение форматируется (lazy %-форматирование и JSON) уже в потоке вывода;
+- при переполнении очереди (LOG_QUEUE_SIZE) запись отбрасывается, а не ждёт
+  (метрика log_records_dropped_total);
+- частые INFO-записи, помеченные extra={'sampled': True}, пропускаются с
+  вероятностью 1 - LOG_INFO_SAMPLE_RATE ещё до постановки в очередь.
+
+Access log gunicorn отключён (gunicorn.conf.py): запись о запросе (логгер access)
+пишет само приложение через ту же очередь, а сообщения gunicorn.error в воркере
+передаются корневому логгеру.
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+from config import Config
+from metrics import LOG_RECORDS_DROPPED
+
+access_logger = logging.getLogger('access')
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога — одна строка JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        endpoint = getattr(record, 'endpoint', None)
+        if endpoint:
+            entry['endpoint'] = endpoint
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей уровня INFO и ниже, помеченных extra={'sampled': True}"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.INFO or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который не форматирует запись в потоке запроса и не ждёт при полной очереди"""
+
+    def prepare(self, record):
+        # Очередь внутрипроцессная: запись передаётся как есть, сообщение форматирует поток вывода.
+        # Endpoint запоминается сейчас — в потоке вывода контекста запроса уже нет
+        if has_request_context():
+            record.endpoint = request.endpoint
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+def setup_logging():
+    """Настройка корневого логгера процесса (повторный вызов ничего не меняет)"""
+    global _listener
+
+    with _setup_lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(sys.stderr)
+        if Config.LOG_FORMAT == 'json':
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s'))
+
+        log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_SIZE)
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        if Config.LOG_INFO_SAMPLE_RATE < 1:
+            queue_handler.addFilter(SamplingFilter(Config.LOG_INFO_SAMPLE_RATE))
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(Config.LOG_LEVEL)
+
+        # Под gunicorn у его логгеров свои синхронные StreamHandler: в воркере их записи
+        # идут через очередь корневого логгера, в том же формате, что и логи приложения
+        for name in ('gunicorn.error', 'gunicorn.access'):
+            gunicorn_logger = logging.getLogger(name)
+            for handler in list(gunicorn_logger.handlers):
+                gunicorn_logger.removeHandler(handler)
+            gunicorn_logger.propagate = True
+
+        _listener = QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        # Дописать оставшиеся в очереди записи при завершении процесса
+        atexit.register(_listener.stop)
+
+
+def _start_access_timer():
+    g.access_started = time.perf_counter()
+
+
+def _log_access(response):
+    started = g.pop('access_started', None)
+    duration_ms = (time.perf_counter() - started) * 1000 if started is not None else 0.0
+    # Только путь без query string: в ней передаётся токен API
+    access_logger.info('%s %s %s %.1f ms', request.method, request.path, response.status_code, duration_ms,
+                       extra={'sampled': True})
+    return response
+
+
+def init_app(app):
+    """Запись access log о каждом запросе (ACCESS_LOG); частая INFO-запись — прореживается LOG_INFO_SAMPLE_RATE"""
+    if not Config.ACCESS_LOG:
+        return
+    app.before_request(_start_access_timer)
+    app.after_request(_log_access)
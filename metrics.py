@@ -0,0 +1,108 @@
+"""
+Метрики веб-приложения в формате Prometheus (GET /api/metrics).
+
+Под gunicorn каждый воркер — отдельный процесс, поэтому метрики пишутся в
+общий каталог PROMETHEUS_MULTIPROC_DIR (задаётся в gunicorn.conf.py) и при
+выдаче суммируются по всем воркерам. Без PROMETHEUS_MULTIPROC_DIR (python app.py)
+используется обычный реестр процесса.
+"""
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests', ['method', 'endpoint', 'status']
+)
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ['method', 'endpoint'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests being processed', ['method', 'endpoint'],
+    multiprocess_mode='livesum'
+)
+# Скорость приёма — rate(upload_bytes_total[1m])
+UPLOAD_BYTES = Counter(
+    'upload_bytes_total', 'Uploaded file bytes received', ['kind']
+)
+DB_POOL_CHECKOUT_DURATION = Histogram(
+    'db_pool_checkout_seconds', 'Time to get a connection from the DB pool',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    'db_pool_checkout_timeouts_total', 'DB pool exhausted: no connection within pool_timeout'
+)
+DB_POOL_CONNECTIONS_IN_USE = Gauge(
+    'db_pool_connections_in_use', 'DB connections checked out of the pool',
+    multiprocess_mode='livesum'
+)
+DB_POOL_CAPACITY = Gauge(
+    'db_pool_capacity', 'DB pool size + max_overflow',
+    multiprocess_mode='livesum'
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'SQL statement execution time',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'SQL statements per HTTP request', ['endpoint'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    'db_time_per_request_seconds', 'Total SQL time per HTTP request', ['endpoint'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total', 'Log records dropped because the log queue was full'
+)
+TELEGRAM_VALIDATION_FAILURES = Counter(
+    'telegram_validation_failures_total', 'Rejected Telegram WebApp requests', ['reason']
+)
+
+
+def _request_labels():
+    # Имя endpoint, а не путь: число серий не зависит от параметров в URL
+    return request.method, request.endpoint or 'unmatched'
+
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_labels = _request_labels()
+    HTTP_REQUESTS_IN_PROGRESS.labels(*g.metrics_labels).inc()
+
+
+def _record_response(response):
+    g.metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exc):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    method, endpoint = g.pop('metrics_labels')
+    status = g.pop('metrics_status', 500)
+    HTTP_REQUESTS_IN_PROGRESS.labels(method, endpoint).dec()
+    HTTP_REQUEST_DURATION.labels(method, endpoint).observe(time.perf_counter() - started)
+    HTTP_REQUESTS.labels(method, endpoint, str(status)).inc()
+
+
+def init_app(app):
+    """Учёт запросов приложения (время, статус, запросы в обработке)"""
+    app.before_request(_start_request)
+    app.after_request(_record_response)
+    app.teardown_request(_finish_request)
+
+
+def metrics_payload():
+    """Метрики в текстовом формате Prometheus: (тело, Content-Type)"""
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import db
@@ -27,6 +27,10 @@ class City(db.Model):
 
 class Object(db.Model):
     __tablename__ = 'objects'
+    __table_args__ = (
+        # Покрывающий индекс списка объектов города (WHERE city_id ORDER BY name) и загрузки кэша справочников
+        Index('ix_objects_city_id_name', 'city_id', 'name', 'btxid', 'state'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     city_id = Column(Integer, ForeignKey('cities.id', ondelete='CASCADE'), nullable=False)
@@ -69,6 +73,10 @@ class ViolationCategory(db.Model):
 
 class Violation(db.Model):
     __tablename__ = 'violations'
+    __table_args__ = (
+        # Покрывающий индекс списка нарушений категории (WHERE category_id ORDER BY name) и загрузки кэша справочников
+        Index('ix_violations_category_id_name', 'category_id', 'name', 'btxid', 'state'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     category_id = Column(Integer, ForeignKey('violation_categories.id', ondelete='CASCADE'), nullable=False)
@@ -92,6 +100,12 @@ class Violation(db.Model):
 
 class FormSubmission(db.Model):
     __tablename__ = 'form_submissions'
+    __table_args__ = (
+        # Постраничный вывод по курсору в GET /api/submissions (ORDER BY created_at DESC, id DESC)
+        Index('ix_form_submissions_created_at_id', 'created_at', 'id'),
+        # Отправки пользователя Telegram по дате (GET /api/submissions?telegram_user_id=)
+        Index('ix_form_submissions_telegram_user_id_created_at', 'telegram_user_id', 'created_at'),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     city_id = Column(Integer, ForeignKey('cities.btxid', ondelete='RESTRICT'), nullable=True)  # btxid города в Bitrix24 (NULL если город без btxid)
@@ -153,3 +167,10 @@ class User(db.Model):
         return ''.join(secrets.choice(alphabet) for _ in range(32))
 
 
+class SchemaVersion(db.Model):
+    """Версия схемы БД: одна строка с номером последнего применённого шага database.MIGRATIONS"""
+    __tablename__ = 'schema_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
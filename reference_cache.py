@@ -0,0 +1,313 @@
+"""
+In-process кэш справочников (города, объекты, категории нарушений, нарушения).
+
+Справочники меняются только при ночной синхронизации с Bitrix24 и при вызове
+POST/PUT endpoints, поэтому GET-запросы формы обслуживаются из памяти воркера.
+Кэш хранит неизменяемый снимок данных с номером версии:
+- прогревается при старте приложения;
+- сбрасывается обработчиками создания/обновления в routes.py;
+- перечитывается по истечении REFERENCE_CACHE_TTL (изменения из bitrix-sync
+  и из других воркеров попадают в кэш не позже чем через TTL).
+
+Для каждой таблицы вычисляется версия данных — хэш содержимого. Она одинакова
+во всех воркерах при одинаковых данных и используется как ETag в GET-ответах.
+
+Тела GET-ответов (JSON) и их сжатые варианты (gzip и, если установлен пакет
+brotli, br) строятся один раз для каждого снимка при первом обращении, поэтому
+обработчик только выбирает вариант по Accept-Encoding.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен: без него отдаются только gzip и несжатые ответы
+    brotli = None
+
+from sqlalchemy import select
+
+from config import Config
+from database import db
+from models import City, Object, ViolationCategory, Violation
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceSnapshot:
+    """Снимок справочников на момент загрузки (только для чтения)"""
+
+    def __init__(
+        self,
+        version: int,
+        cities: List[dict],
+        categories: List[dict],
+        objects_by_city: Dict[int, List[dict]],
+        violations_by_category: Dict[int, List[dict]],
+    ):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.cities = cities
+        self.categories = categories
+        # Ключ — btxid города / категории (именно его передаёт форма)
+        self.objects_by_city = objects_by_city
+        self.violations_by_category = violations_by_category
+        # Версии данных по таблицам (хэш содержимого), используются для ETag
+        self.versions = {
+            'cities': _data_version(cities),
+            'objects': _data_version(objects_by_city),
+            'violation_categories': _data_version(categories),
+            'violations': _data_version(violations_by_category),
+        }
+        # Общая версия набора справочников (для /api/bootstrap)
+        self.dataset_version = _data_version(self.versions)
+        # Индексы btxid -> (локальный id, btxid родителя) для проверки отправки формы
+        self.object_index: Dict[int, Tuple[int, int]] = {
+            obj['btxid']: (obj['id'], city_btxid)
+            for city_btxid, items in objects_by_city.items()
+            for obj in items if obj['btxid'] is not None
+        }
+        self.violation_index: Dict[int, Tuple[int, int]] = {
+            violation['btxid']: (violation['id'], category_btxid)
+            for category_btxid, items in violations_by_category.items()
+            for violation in items if violation['btxid'] is not None
+        }
+        # Готовые тела ответов, строятся при первом обращении.
+        # Первый элемент ключа — версия данных тела (версия таблицы или dataset_version)
+        self._bodies: Dict[tuple, EncodedBody] = {}
+        self._bodies_lock = threading.Lock()
+
+    def etag(self, table: str, parent_btxid: Optional[int] = None) -> str:
+        """Строгий ETag списка: версия таблицы (+ btxid родителя для вложенных списков)"""
+        if parent_btxid is None:
+            return f"{table}-{self.versions[table]}"
+        return f"{table}-{parent_btxid}-{self.versions[table]}"
+
+    def list_body(self, table: str, parent_btxid: Optional[int] = None) -> 'EncodedBody':
+        """Тело ответа GET-списка справочника ({"data": [...], "success": true})"""
+        def build():
+            if table == 'cities':
+                data = self.cities
+            elif table == 'violation_categories':
+                data = self.categories
+            elif table == 'objects':
+                data = self.objects_by_city[parent_btxid]
+            else:
+                data = self.violations_by_category[parent_btxid]
+            return _dumps({'success': True, 'data': data})
+
+        return self._body((self.versions[table], table, parent_btxid), build)
+
+    def bootstrap_body(self, access: dict, unchanged: bool = False) -> 'EncodedBody':
+        """Тело ответа /api/bootstrap для данного результата проверки доступа.
+
+        unchanged=True — у клиента уже есть справочники этой версии: data равно null, unchanged — true.
+        """
+        if unchanged:
+            return self._body((self.dataset_version, 'bootstrap_unchanged', access['checked'], access['authorized']), lambda: _dumps({
+                'access': access,
+                'data': None,
+                'success': True,
+                'unchanged': True,
+                'version': self.dataset_version,
+            }))
+
+        # Набор справочников сериализуется один раз и подставляется в ответы для всех вариантов access
+        data = self._body((self.dataset_version, 'bootstrap_data'), lambda: _dumps({
+            'cities': self.cities,
+            'violation_categories': self.categories,
+            'objects': self.objects_by_city,
+            'violations': self.violations_by_category,
+        }, newline=False), compress=False).identity
+
+        def build():
+            return b''.join([
+                b'{"access":', _dumps(access, newline=False),
+                b',"data":', data,
+                b',"success":true,"version":', _dumps(self.dataset_version, newline=False),
+                b'}\n',
+            ])
+
+        return self._body((self.dataset_version, 'bootstrap', access['checked'], access['authorized']), build)
+
+    def _body(self, key: tuple, build, compress: bool = True) -> 'EncodedBody':
+        body = self._bodies.get(key)
+        if body is None:
+            with self._bodies_lock:
+                body = self._bodies.get(key)
+                if body is None:
+                    body = EncodedBody(build(), compress=compress)
+                    self._bodies[key] = body
+        return body
+
+    def carry_bodies(self, previous: 'ReferenceSnapshot'):
+        """Взять из предыдущего снимка готовые тела, данные которых не изменились"""
+        current = set(self.versions.values()) | {self.dataset_version}
+        with previous._bodies_lock:
+            bodies = {key: body for key, body in previous._bodies.items() if key[0] in current}
+        with self._bodies_lock:
+            self._bodies.update(bodies)
+
+    def has_city(self, city_btxid: int) -> bool:
+        return city_btxid in self.objects_by_city
+
+    def has_category(self, category_btxid: int) -> bool:
+        return category_btxid in self.violations_by_category
+
+
+class EncodedBody:
+    """Сериализованное тело ответа и его сжатые варианты (None — сжатие не уменьшает размер)"""
+
+    __slots__ = ('identity', 'gzip', 'br')
+
+    def __init__(self, payload: bytes, compress: bool = True):
+        self.identity = payload
+        self.gzip = None
+        self.br = None
+        if compress:
+            self.gzip = _smaller(gzip.compress(payload, compresslevel=9, mtime=0), payload)
+            if brotli is not None:
+                self.br = _smaller(brotli.compress(payload, quality=11), payload)
+
+    @property
+    def encodings(self) -> List[str]:
+        """Доступные варианты в порядке предпочтения сервера"""
+        return [encoding for encoding in ('br', 'gzip') if getattr(self, encoding) is not None] + ['identity']
+
+    def variant(self, encoding: str) -> bytes:
+        return getattr(self, encoding)
+
+
+def _smaller(compressed: bytes, payload: bytes) -> Optional[bytes]:
+    return compressed if len(compressed) < len(payload) else None
+
+
+def _dumps(data, newline: bool = True) -> bytes:
+    """JSON в том же виде, что и jsonify (ключи по алфавиту, компактно, ASCII)"""
+    payload = json.dumps(data, ensure_ascii=True, sort_keys=True, separators=(',', ':')).encode('ascii')
+    return payload + b'\n' if newline else payload
+
+
+def _data_version(data) -> str:
+    """Версия данных: хэш от канонического JSON-представления"""
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+class ReferenceCache:
+    """Версионированный кэш справочников, общий для всех потоков воркера"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot: Optional[ReferenceSnapshot] = None
+        # Последний загруженный снимок (и после invalidate): его готовые тела переносятся в новый
+        self._last: Optional[ReferenceSnapshot] = None
+        self._version = 0
+
+    def get(self) -> ReferenceSnapshot:
+        """Текущий снимок; при отсутствии или устаревании загружается из БД"""
+        snapshot = self._snapshot
+        if snapshot is not None and not self._is_expired(snapshot):
+            return snapshot
+
+        with self._lock:
+            # Другой поток мог уже перезагрузить снимок, пока мы ждали блокировку
+            snapshot = self._snapshot
+            if snapshot is None or self._is_expired(snapshot):
+                snapshot = self._load()
+                previous = self._last
+                if previous is not None and previous.dataset_version == snapshot.dataset_version:
+                    # Данные не изменились: прежний снимок с уже построенными телами продолжает работать
+                    previous.loaded_at = snapshot.loaded_at
+                    snapshot = previous
+                elif previous is not None:
+                    snapshot.carry_bodies(previous)
+                self._snapshot = self._last = snapshot
+            return snapshot
+
+    def warm(self):
+        """Прогрев кэша (вызывается при старте приложения)"""
+        self.get()
+
+    def invalidate(self):
+        """Сбросить снимок: следующий запрос перечитает справочники из БД"""
+        with self._lock:
+            self._snapshot = None
+
+    def resolve_submission_refs(
+        self, city_btxid: int, object_btxid: int, category_btxid: int, violation_btxid: int
+    ) -> Tuple[bool, Optional[int], bool, Optional[int]]:
+        """
+        Данные для проверки иерархии город -> объект и категория -> нарушение (все значения — btxid).
+
+        Returns:
+            (город существует, btxid города объекта, категория существует, btxid категории нарушения)
+        """
+        snapshot = self.get()
+        object_ref = snapshot.object_index.get(object_btxid)
+        violation_ref = snapshot.violation_index.get(violation_btxid)
+        refs = (
+            snapshot.has_city(city_btxid),
+            object_ref[1] if object_ref else None,
+            snapshot.has_category(category_btxid),
+            violation_ref[1] if violation_ref else None,
+        )
+        if refs == (True, city_btxid, True, category_btxid):
+            return refs
+
+        # Снимок мог устареть (например, запись добавлена bitrix-sync) — перепроверяем одним запросом
+        row = db.session.execute(select(
+            select(City.id).where(City.btxid == city_btxid).scalar_subquery(),
+            select(City.btxid).join(Object, Object.city_id == City.id)
+            .where(Object.btxid == object_btxid).scalar_subquery(),
+            select(ViolationCategory.id).where(ViolationCategory.btxid == category_btxid).scalar_subquery(),
+            select(ViolationCategory.btxid).join(Violation, Violation.category_id == ViolationCategory.id)
+            .where(Violation.btxid == violation_btxid).scalar_subquery(),
+        )).one()
+        return row[0] is not None, row[1], row[2] is not None, row[3]
+
+    def _is_expired(self, snapshot: ReferenceSnapshot) -> bool:
+        return self.ttl > 0 and time.monotonic() - snapshot.loaded_at > self.ttl
+
+    def _load(self) -> ReferenceSnapshot:
+        """Загрузка всех справочников: по одному запросу на таблицу"""
+        cities = City.query.order_by(City.name).all()
+        categories = ViolationCategory.query.order_by(ViolationCategory.name).all()
+
+        # Объекты и нарушения ссылаются на локальный id родителя, а API работает с btxid
+        city_btxid_by_id = {city.id: city.btxid for city in cities if city.btxid is not None}
+        category_btxid_by_id = {cat.id: cat.btxid for cat in categories if cat.btxid is not None}
+
+        # Порядок (родитель, имя) читается по индексу без сортировки
+        objects_by_city = {btxid: [] for btxid in city_btxid_by_id.values()}
+        for obj in Object.query.order_by(Object.city_id, Object.name).all():
+            city_btxid = city_btxid_by_id.get(obj.city_id)
+            if city_btxid is not None:
+                objects_by_city[city_btxid].append(obj.to_dict())
+
+        violations_by_category = {btxid: [] for btxid in category_btxid_by_id.values()}
+        for violation in Violation.query.order_by(Violation.category_id, Violation.name).all():
+            category_btxid = category_btxid_by_id.get(violation.category_id)
+            if category_btxid is not None:
+                violations_by_category[category_btxid].append(violation.to_dict())
+
+        self._version += 1
+        logger.info(
+            "loaded version %s (%s cities, %s categories)",
+            self._version, len(cities), len(categories)
+        )
+        return ReferenceSnapshot(
+            version=self._version,
+            cities=[city.to_dict() for city in cities],
+            categories=[cat.to_dict() for cat in categories],
+            objects_by_city=objects_by_city,
+            violations_by_category=violations_by_category,
+        )
+
+
+reference_cache = ReferenceCache(Config.REFERENCE_CACHE_TTL)
@@ -1,10 +1,26 @@
-import os
-from flask import Blueprint, request, jsonify, send_from_directory
+import csv
+import json
+import logging
+import time
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify, send_from_directory, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
+from sqlalchemy import and_, or_, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from database import db
 from models import City, Object, ViolationCategory, Violation, FormSubmission, User
 from config import Config
-from telegram_validation import validate_telegram_webapp_data
+from telegram_validation import get_validator, parse_telegram_webapp_data
+from reference_cache import reference_cache
+from authorized_users import authorized_users
+from uploads import UploadRejected, UploadSession
+from db_pool import pool_stats
+from metrics import TELEGRAM_VALIDATION_FAILURES, metrics_payload
+
+logger = logging.getLogger(__name__)
 
 api = Blueprint('api', __name__)
 
@@ -50,10 +66,34 @@ def check_api_token():
     return None
 
 
+def check_request_size():
+    """Отклонение запроса по Content-Length до разбора тела.
+
+    Клиент сразу получает 413, но gunicorn с keep-alive дочитывает непрочитанное
+    тело при следующем чтении соединения: поток воркера защищает только лимит
+    на reverse proxy (client_max_body_size, см. nginx.conf.example).
+    """
+    if request.content_length is not None and request.content_length > Config.MAX_CONTENT_LENGTH:
+        if request.endpoint == 'api.submit_form':
+            error = (f'Request is too large: maximum {Config.MAX_FILES} files of '
+                     f'{Config.MAX_FILE_SIZE / 1024 / 1024} MB each are allowed')
+        else:
+            error = f'Request is too large: maximum {Config.MAX_CONTENT_LENGTH} bytes are allowed'
+        return jsonify({
+            'success': False,
+            'error': error
+        }), 413
+    return None
+
+
 # Применяем проверку токена ко всем запросам к API
 @api.before_request
 def before_request():
-    """Проверка токена перед обработкой каждого запроса"""
+    """Проверка размера запроса и токена перед обработкой каждого запроса"""
+    error_response = check_request_size()
+    if error_response:
+        return error_response
+
     # Исключаем публичные endpoints из проверки токена - они используются из Telegram WebApp
     # и имеют свою проверку через Telegram initData
     public_endpoints = [
@@ -62,11 +102,18 @@ def before_request():
         '/objects',              # GET - загрузка объектов по городу
         '/violation-categories', # GET - загрузка категорий нарушений
         '/violations',          # GET - загрузка нарушений по категории
+        '/bootstrap',           # GET - начальная загрузка формы одним запросом
         '/submit'               # POST - отправка формы (проверяется через Telegram initData)
     ]
     
+    # Загрузка файлов по частям из Telegram WebApp (проверяется через Telegram initData)
+    public_path_parts = [
+        '/upload-sessions'
+    ]
+    
     # Проверяем, является ли текущий путь публичным endpoint
-    is_public = any(request.path.endswith(endpoint) for endpoint in public_endpoints)
+    is_public = any(request.path.endswith(endpoint) for endpoint in public_endpoints) or \
+        any(part in request.path for part in public_path_parts)
     
     # Для GET запросов к справочникам и POST к /submit - пропускаем проверку токена
     # (они проверяются через Telegram initData в самих функциях)
@@ -117,44 +164,298 @@ def get_request_data():
     return data
 
 
+def read_bulk_items():
+    """Записи для пакетной загрузки: JSON-массив, {"items": [...]} или NDJSON (по строке на запись)"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('items')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array, {"items": [...]} or NDJSON body')
+    return data
+
+
+# Размер порции INSERT ... ON DUPLICATE KEY UPDATE (ON CONFLICT) при пакетной загрузке
+BULK_UPSERT_CHUNK_SIZE = 1000
+# СУБД, для которых есть INSERT с обновлением существующей записи
+UPSERT_DIALECTS = ('mysql', 'sqlite', 'postgresql')
+
+
+def upsert_statement(table, rows):
+    """INSERT строк rows с обновлением записей, у которых btxid уже есть в таблице"""
+    update_columns = [column for column in rows[0] if column != 'btxid']
+    if db.engine.dialect.name == 'mysql':
+        stmt = mysql_insert(table).values(rows)
+        return stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in update_columns})
+    insert = sqlite_insert if db.engine.dialect.name == 'sqlite' else postgresql_insert
+    stmt = insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=['btxid'],
+        set_={column: stmt.excluded[column] for column in update_columns}
+    )
+
+
+def bulk_upsert(model, parent=None, unique_name=False):
+    """
+    Пакетное создание/обновление записей справочника по btxid в одной транзакции.
+
+    Args:
+        model: Модель справочника (City, Object, ViolationCategory, Violation)
+        parent: (модель родителя, FK-колонка, префикс параметра) для объектов и нарушений,
+            например (City, 'city_id', 'city'): родитель задаётся как city_btxid или city_id (локальный id)
+        unique_name: имя уникально в таблице (города, категории)
+
+    Returns:
+        Список результатов по записям в порядке запроса: status created / updated / error
+    """
+    items = read_bulk_items()
+    results = [{'index': i} for i in range(len(items))]
+    has_state = 'state' in model.__table__.columns
+    pending = {}  # btxid -> (индекс записи, значения, ссылка на родителя)
+
+    def reject(index, error):
+        results[index].update(status='error', error=error)
+
+    # Проверка отдельных записей
+    for i, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ValueError('Record must be an object')
+            if item.get('btxid') in (None, ''):
+                raise ValueError('Field btxid is required')
+            btxid = int(item.get('btxid'))
+            results[i]['btxid'] = btxid
+            name = str(item.get('name') or '').strip()
+            if not name:
+                raise ValueError('Field name is required')
+            if btxid in pending:
+                raise ValueError('Duplicate btxid in request')
+
+            values = {'btxid': btxid, 'name': name}
+            if has_state:
+                values['state'] = item.get('state') or None
+
+            parent_ref = None
+            if parent:
+                prefix = parent[2]
+                if item.get(f'{prefix}_btxid') not in (None, ''):
+                    parent_ref = ('btxid', int(item.get(f'{prefix}_btxid')))
+                elif item.get(f'{prefix}_id') not in (None, ''):
+                    parent_ref = ('id', int(item.get(f'{prefix}_id')))
+                else:
+                    raise ValueError(f'Field {prefix}_btxid or {prefix}_id is required')
+
+            pending[btxid] = (i, values, parent_ref)
+        except (ValueError, TypeError) as e:
+            reject(i, str(e))
+
+    # Родители: по одному запросу на все btxid и все локальные id
+    if parent and pending:
+        parent_model, fk_column, prefix = parent
+        refs = [ref for _, _, ref in pending.values()]
+        parent_btxids = {value for kind, value in refs if kind == 'btxid'}
+        parent_ids = {value for kind, value in refs if kind == 'id'}
+        id_by_btxid = dict(db.session.execute(
+            select(parent_model.btxid, parent_model.id).where(parent_model.btxid.in_(parent_btxids))
+        ).all()) if parent_btxids else {}
+        known_ids = set(db.session.scalars(
+            select(parent_model.id).where(parent_model.id.in_(parent_ids))
+        )) if parent_ids else set()
+
+        for btxid, (i, values, (kind, value)) in list(pending.items()):
+            local_id = id_by_btxid.get(value) if kind == 'btxid' else (value if value in known_ids else None)
+            if local_id is None:
+                reject(i, f'Invalid {prefix}_{kind}: {prefix} not found')
+                del pending[btxid]
+            else:
+                values[fk_column] = local_id
+
+    # Уникальность имени: имя не должно принадлежать записи с другим btxid
+    if unique_name and pending:
+        seen_names = set()
+        for btxid, (i, values, _) in list(pending.items()):
+            key = values['name'].lower()
+            if key in seen_names:
+                reject(i, 'Duplicate name in request')
+                del pending[btxid]
+            seen_names.add(key)
+        owner_by_name = {
+            name.lower(): owner_btxid for name, owner_btxid in db.session.execute(
+                select(model.name, model.btxid).where(model.name.in_([v['name'] for _, v, _ in pending.values()]))
+            )
+        } if pending else {}
+        for btxid, (i, values, _) in list(pending.items()):
+            key = values['name'].lower()
+            if key in owner_by_name and owner_by_name[key] != btxid:
+                reject(i, 'Record with this name already exists')
+                del pending[btxid]
+
+    if pending:
+        existing = set(db.session.scalars(select(model.btxid).where(model.btxid.in_(list(pending)))))
+        rows = [values for _, values, _ in pending.values()]
+        for start in range(0, len(rows), BULK_UPSERT_CHUNK_SIZE):
+            db.session.execute(upsert_statement(model.__table__, rows[start:start + BULK_UPSERT_CHUNK_SIZE]))
+        db.session.commit()
+        reference_cache.invalidate()
+
+        for btxid, (i, _, _) in pending.items():
+            results[i]['status'] = 'updated' if btxid in existing else 'created'
+
+    return results
+
+
+def bulk_upsert_response(model, parent=None, unique_name=False):
+    """Ответ endpoint пакетной загрузки"""
+    if db.engine.dialect.name not in UPSERT_DIALECTS:
+        return jsonify({
+            'success': False,
+            'error': f'Bulk upload is not supported for database {db.engine.dialect.name}'
+        }), 501
+
+    try:
+        results = bulk_upsert(model, parent=parent, unique_name=unique_name)
+        return jsonify({
+            'success': True,
+            'data': results,
+            'created': sum(1 for r in results if r.get('status') == 'created'),
+            'updated': sum(1 for r in results if r.get('status') == 'updated'),
+            'errors': sum(1 for r in results if r.get('status') == 'error')
+        }), 200
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid data format: {str(e)}'
+        }), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 def allowed_file(filename):
     """Проверка имени файла (типы не ограничиваем)"""
     return bool(filename)
 
 
+def read_telegram_init_data(init_data):
+    """
+    Разбор Telegram initData за один проход.
+
+    Если задан TELEGRAM_BOT_TOKEN, подпись проверяется (с кэшем уже проверенных initData).
+    Возвращает TelegramInitData или None, если подпись неверна.
+    """
+    if Config.TELEGRAM_BOT_TOKEN:
+        validator = get_validator(
+            Config.TELEGRAM_BOT_TOKEN,
+            Config.TELEGRAM_INIT_DATA_CACHE_SIZE,
+            Config.TELEGRAM_INIT_DATA_CACHE_TTL
+        )
+        telegram_data = validator.validate(init_data)
+        if telegram_data is None:
+            TELEGRAM_VALIDATION_FAILURES.labels('invalid_signature').inc()
+        return telegram_data
+    return parse_telegram_webapp_data(init_data)
+
+
+def encoded_response(body, etag=None):
+    """
+    Ответ с заранее сериализованным телом (reference_cache.EncodedBody): сжатый вариант
+    выбирается по Accept-Encoding, сериализация и сжатие на запрос не выполняются.
+    С etag поддерживается условный GET (If-None-Match -> 304), ETag у каждого варианта свой.
+    """
+    encoding = request.accept_encodings.best_match(body.encodings, default='identity')
+    variant_etag = etag if etag is None or encoding == 'identity' else f"{etag}-{encoding}"
+
+    if variant_etag and request.if_none_match.contains_weak(variant_etag):
+        # У клиента уже есть эта версия данных — тело не передаём
+        response = Response(status=304)
+    else:
+        response = Response(body.variant(encoding), mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+
+    if variant_etag:
+        response.set_etag(variant_etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def reference_response(snapshot, table, parent_btxid=None):
+    """Ответ GET-списка справочника из снимка кэша (готовое тело, ETag по версии данных)"""
+    response = encoded_response(snapshot.list_body(table, parent_btxid), snapshot.etag(table, parent_btxid))
+    # Клиент может хранить ответ, но обязан перепроверять его при каждом запросе
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
 def is_authorized_telegram_user(telegram_user_id):
-    """Проверяет, есть ли пользователь с данным tg_id в базе данных"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
+    """Проверяет, есть ли пользователь с данным tg_id в базе данных (через in-process кэш)"""
     if not telegram_user_id:
-        logger.warning(f"is_authorized_telegram_user: telegram_user_id is None or empty")
+        logger.warning("is_authorized_telegram_user: telegram_user_id is None or empty")
         return False
 
-    logger.info(f"is_authorized_telegram_user: checking telegram_user_id={telegram_user_id}, type={type(telegram_user_id)}")
-    
-    user = User.query.filter_by(tg_id=telegram_user_id).first()
-    
-    if user:
-        logger.info(f"is_authorized_telegram_user: user found - id={user.id}, tg_id={user.tg_id}, type(tg_id)={type(user.tg_id)}")
-    else:
-        logger.warning(f"is_authorized_telegram_user: user NOT found for telegram_user_id={telegram_user_id}")
-        # Логируем все пользователей в БД для отладки
-        all_users = User.query.all()
-        logger.info(f"is_authorized_telegram_user: all users in DB: {[(u.id, u.tg_id, type(u.tg_id)) for u in all_users]}")
+    authorized = authorized_users.contains(telegram_user_id)
+    if not authorized:
+        logger.warning("is_authorized_telegram_user: user NOT found for telegram_user_id=%s", telegram_user_id)
     
-    return user is not None
+    return authorized
+
+
+@api.route('/bootstrap', methods=['GET'])
+def bootstrap():
+    """Начальная загрузка формы одним запросом: доступ пользователя и все справочники.
+
+    Объекты и нарушения сгруппированы по btxid города / категории, поэтому
+    при смене города или категории клиенту не нужны дополнительные запросы.
+    Параметр version — версия справочников в кэше клиента: если она актуальна,
+    справочники не передаются (data = null, unchanged = true).
+    """
+    try:
+        # Проверка доступа по Telegram initData (как в /users/check-access)
+        access = {'checked': False, 'authorized': None}
+        init_data = request.headers.get('X-Telegram-Init-Data')
+        if init_data:
+            telegram_data = read_telegram_init_data(init_data)
+            if telegram_data is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid Telegram WebApp data'
+                }), 401
+
+            telegram_user_id = telegram_data.user_id
+            access = {
+                'checked': True,
+                'authorized': bool(telegram_user_id) and is_authorized_telegram_user(telegram_user_id)
+            }
+
+        if access['authorized'] is False:
+            return jsonify({
+                'success': True,
+                'access': access,
+                'data': None
+            }), 200
+
+        # Тело собирается из заранее сериализованного набора справочников
+        snapshot = reference_cache.get()
+        unchanged = request.args.get('version') == snapshot.dataset_version
+        return encoded_response(snapshot.bootstrap_body(access, unchanged=unchanged))
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
 
 @api.route('/cities', methods=['GET'])
 def get_cities():
     """Получить список всех городов"""
     try:
-        cities = City.query.order_by(City.name).all()
-        return jsonify({
-            'success': True,
-            'data': [city.to_dict() for city in cities]
-        }), 200
+        snapshot = reference_cache.get()
+        return reference_response(snapshot, 'cities')
     except Exception as e:
         return jsonify({
             'success': False,
@@ -192,6 +493,7 @@ def create_city():
 
         db.session.add(city)
         db.session.commit()
+        reference_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -240,6 +542,7 @@ def update_city(city_id):
             city.btxid = int(data.get('btxid')) if data.get('btxid') else None
 
         db.session.commit()
+        reference_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -260,6 +563,12 @@ def update_city(city_id):
         }), 500
 
 
+@api.route('/cities/bulk', methods=['POST'])
+def bulk_upsert_cities():
+    """Пакетное создание/обновление городов по btxid (одна транзакция)"""
+    return bulk_upsert_response(City, unique_name=True)
+
+
 @api.route('/objects', methods=['GET'])
 def get_objects():
     """Получить список объектов по городу (city_id — btxid города в Bitrix24)."""
@@ -270,17 +579,13 @@ def get_objects():
                 'success': False,
                 'error': 'city_id parameter is required'
             }), 400
-        city = City.query.filter_by(btxid=city_id).first()
-        if not city:
+        snapshot = reference_cache.get()
+        if not snapshot.has_city(city_id):
             return jsonify({
                 'success': False,
                 'error': 'City not found'
             }), 400
-        objects = Object.query.filter_by(city_id=city.id).order_by(Object.name).all()
-        return jsonify({
-            'success': True,
-            'data': [obj.to_dict() for obj in objects]
-        }), 200
+        return reference_response(snapshot, 'objects', city_id)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -292,16 +597,14 @@ def get_objects():
 def create_object():
     """Создать новый объект"""
     try:
-        import logging
-        logger = logging.getLogger(__name__)
         data = get_request_data()
-        logger.info(f"create_object: received data: {data}, request.args: {dict(request.args)}, request.form: {dict(request.form)}")
+        logger.debug("create_object: received fields %s", list(data))
 
         required_fields = ['city_id', 'name']
         for field in required_fields:
             value = data.get(field)
             if not value or (isinstance(value, str) and not value.strip()):
-                logger.warning(f"create_object: missing or empty field '{field}', data: {data}")
+                logger.warning("create_object: missing or empty field %r", field)
                 return jsonify({
                     'success': False,
                     'error': f'Field {field} is required'
@@ -327,6 +630,7 @@ def create_object():
 
         db.session.add(obj)
         db.session.commit()
+        reference_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -381,6 +685,7 @@ def update_object(object_id):
             obj.state = data.get('state') or None
 
         db.session.commit()
+        reference_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -401,15 +706,18 @@ def update_object(object_id):
         }), 500
 
 
+@api.route('/objects/bulk', methods=['POST'])
+def bulk_upsert_objects():
+    """Пакетное создание/обновление объектов по btxid (одна транзакция)"""
+    return bulk_upsert_response(Object, parent=(City, 'city_id', 'city'))
+
+
 @api.route('/violation-categories', methods=['GET'])
 def get_violation_categories():
     """Получить список категорий нарушений"""
     try:
-        categories = ViolationCategory.query.order_by(ViolationCategory.name).all()
-        return jsonify({
-            'success': True,
-            'data': [cat.to_dict() for cat in categories]
-        }), 200
+        snapshot = reference_cache.get()
+        return reference_response(snapshot, 'violation_categories')
     except Exception as e:
         return jsonify({
             'success': False,
@@ -447,6 +755,7 @@ def create_violation_category():
 
         db.session.add(category)
         db.session.commit()
+        reference_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -495,6 +804,7 @@ def update_violation_category(category_id):
             category.btxid = int(data.get('btxid')) if data.get('btxid') else None
 
         db.session.commit()
+        reference_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -515,6 +825,12 @@ def update_violation_category(category_id):
         }), 500
 
 
+@api.route('/violation-categories/bulk', methods=['POST'])
+def bulk_upsert_violation_categories():
+    """Пакетное создание/обновление категорий нарушений по btxid (одна транзакция)"""
+    return bulk_upsert_response(ViolationCategory, unique_name=True)
+
+
 @api.route('/violations', methods=['GET'])
 def get_violations():
     """Получить список нарушений по категории (category_id — btxid категории в Bitrix24)."""
@@ -525,17 +841,13 @@ def get_violations():
                 'success': False,
                 'error': 'category_id parameter is required'
             }), 400
-        category = ViolationCategory.query.filter_by(btxid=category_id).first()
-        if not category:
+        snapshot = reference_cache.get()
+        if not snapshot.has_category(category_id):
             return jsonify({
                 'success': False,
                 'error': 'Category not found'
             }), 400
-        violations = Violation.query.filter_by(category_id=category.id).order_by(Violation.name).all()
-        return jsonify({
-            'success': True,
-            'data': [viol.to_dict() for viol in violations]
-        }), 200
+        return reference_response(snapshot, 'violations', category_id)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -577,6 +889,7 @@ def create_violation():
 
         db.session.add(violation)
         db.session.commit()
+        reference_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -631,6 +944,7 @@ def update_violation(violation_id):
             violation.state = data.get('state') or None
 
         db.session.commit()
+        reference_cache.invalidate()
 
         return jsonify({
             'success': True,
@@ -651,46 +965,213 @@ def update_violation(violation_id):
         }), 500
 
 
-@api.route('/submit', methods=['POST'])
-def submit_form():
-    """Сохранение данных формы"""
+def authorize_webapp_request():
+    """
+    Проверка запроса из Telegram WebApp: подпись initData и регистрация пользователя.
+
+    Returns:
+        (telegram_user_id или None, ответ с ошибкой или None)
+    """
+    # Валидация Telegram WebApp данных (опционально, можно отключить для тестирования)
+    init_data = request.headers.get('X-Telegram-Init-Data')
+    telegram_user_id = None
+    if init_data:
+        telegram_data = read_telegram_init_data(init_data)
+        if telegram_data is None:
+            return None, (jsonify({
+                'success': False,
+                'error': 'Invalid Telegram WebApp data'
+            }), 401)
+        telegram_user_id = telegram_data.user_id
+
+    if telegram_user_id and not is_authorized_telegram_user(telegram_user_id):
+        TELEGRAM_VALIDATION_FAILURES.labels('user_not_registered').inc()
+        logger.warning("authorize_webapp_request: access denied for telegram_user_id=%s", telegram_user_id)
+        return None, (jsonify({
+            'success': False,
+            'error': 'Unauthorized: User is not registered in the system'
+        }), 403)
+
+    return telegram_user_id, None
+
+
+def load_upload_session(upload_id, telegram_user_id):
+    """Сессия загрузки текущего пользователя или ответ 404"""
+    session = UploadSession.load(upload_id)
+    if not session or session.telegram_user_id != telegram_user_id:
+        return None, (jsonify({
+            'success': False,
+            'error': 'Upload session not found'
+        }), 404)
+    return session, None
+
+
+@api.route('/violations/bulk', methods=['POST'])
+def bulk_upsert_violations():
+    """Пакетное создание/обновление нарушений по btxid (одна транзакция)"""
+    return bulk_upsert_response(Violation, parent=(ViolationCategory, 'category_id', 'category'))
+
+
+@api.route('/upload-sessions', methods=['POST'])
+def create_upload_session():
+    """Начать загрузку файла по частям"""
     try:
-        # Валидация Telegram WebApp данных (опционально, можно отключить для тестирования)
-        init_data = request.headers.get('X-Telegram-Init-Data')
-        if init_data and Config.TELEGRAM_BOT_TOKEN:
-            if not validate_telegram_webapp_data(init_data, Config.TELEGRAM_BOT_TOKEN):
-                return jsonify({
-                    'success': False,
-                    'error': 'Invalid Telegram WebApp data'
-                }), 401
+        telegram_user_id, error_response = authorize_webapp_request()
+        if error_response:
+            return error_response
+
+        data = request.get_json(silent=True) or {}
+        session = UploadSession.create(
+            filename=(data.get('filename') or '').strip(),
+            size=int(data.get('size') or 0),
+            telegram_user_id=telegram_user_id,
+            sha256=data.get('sha256')
+        )
+        return jsonify({
+            'success': True,
+            'data': session.to_dict()
+        }), 201
 
-        # Получение user_id из Telegram данных (если есть)
-        import logging
-        logger = logging.getLogger(__name__)
-        telegram_user_id = None
-        if init_data:
-            try:
-                from urllib.parse import parse_qs, unquote
-                parsed_data = parse_qs(unquote(init_data))
-                logger.info(f"submit_form: parsed_data keys: {parsed_data.keys()}")
-                if 'user' in parsed_data:
-                    import json
-                    user_data = json.loads(parsed_data['user'][0])
-                    telegram_user_id = user_data.get('id')
-                    logger.info(f"submit_form: extracted telegram_user_id={telegram_user_id}, type={type(telegram_user_id)}, user_data={user_data}")
-            except Exception as e:
-                logger.error(f"submit_form: error extracting telegram_user_id: {e}", exc_info=True)
-                pass
-
-        # Проверка авторизации пользователя
-        if telegram_user_id and not is_authorized_telegram_user(telegram_user_id):
-            logger.warning(f"submit_form: access denied for telegram_user_id={telegram_user_id}")
+    except UploadRejected as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status_code
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid data format: {str(e)}'
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/upload-sessions/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """Состояние загрузки: сколько байт уже получено (для возобновления после обрыва)"""
+    try:
+        telegram_user_id, error_response = authorize_webapp_request()
+        if error_response:
+            return error_response
+
+        session, error_response = load_upload_session(upload_id, telegram_user_id)
+        if error_response:
+            return error_response
+
+        return jsonify({
+            'success': True,
+            'data': session.to_dict()
+        }), 200
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/upload-sessions/<upload_id>', methods=['PUT'])
+def upload_chunk(upload_id):
+    """Загрузить часть файла: тело запроса — байты части, ?offset= — её смещение в файле"""
+    try:
+        telegram_user_id, error_response = authorize_webapp_request()
+        if error_response:
+            return error_response
+
+        session, error_response = load_upload_session(upload_id, telegram_user_id)
+        if error_response:
+            return error_response
+
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({
+                'success': False,
+                'error': 'offset parameter is required'
+            }), 400
+
+        length = request.content_length
+        if length is None:
             return jsonify({
                 'success': False,
-                'error': 'Unauthorized: User is not registered in the system'
-            }), 403
-        elif telegram_user_id:
-            logger.info(f"submit_form: access granted for telegram_user_id={telegram_user_id}")
+                'error': 'Content-Length is required'
+            }), 411
+        if length > Config.UPLOAD_MAX_CHUNK_SIZE:
+            return jsonify({
+                'success': False,
+                'error': f'Chunk exceeds maximum size of {Config.UPLOAD_MAX_CHUNK_SIZE} bytes'
+            }), 413
+
+        new_offset = session.write_chunk(offset, request.stream, length)
+        return jsonify({
+            'success': True,
+            'data': {
+                'upload_id': session.upload_id,
+                'offset': new_offset,
+                'size': session.size
+            }
+        }), 200
+
+    except UploadRejected as e:
+        # Клиент получает фактическое смещение и продолжает с него
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'data': session.to_dict()
+        }), e.status_code
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/upload-sessions/<upload_id>/finalize', methods=['POST'])
+def finalize_upload_session(upload_id):
+    """Завершить загрузку: идентификатор сессии можно передать в /submit (поле file_tokens)"""
+    try:
+        telegram_user_id, error_response = authorize_webapp_request()
+        if error_response:
+            return error_response
+
+        session, error_response = load_upload_session(upload_id, telegram_user_id)
+        if error_response:
+            return error_response
+
+        session.finalize()
+        return jsonify({
+            'success': True,
+            'data': session.to_dict()
+        }), 200
+
+    except UploadRejected as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'data': session.to_dict()
+        }), e.status_code
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@api.route('/submit', methods=['POST'])
+def submit_form():
+    """Сохранение данных формы"""
+    # Файлы сессий загрузки, перемещённые в uploads: возвращаются в сессии, если запись не сохранится
+    consumed_sessions = []
+    try:
+        # Валидация Telegram WebApp данных и проверка авторизации пользователя
+        telegram_user_id, error_response = authorize_webapp_request()
+        if error_response:
+            return error_response
+        if telegram_user_id:
+            logger.info(
+                "submit_form: access granted for telegram_user_id=%s", telegram_user_id, extra={'sampled': True}
+            )
 
         # Получение данных формы
         data = request.form
@@ -710,47 +1191,64 @@ def submit_form():
         violation_id = int(data.get('violation_id'))  # btxid нарушения
         comment = data.get('comment', '').strip()
 
-        # Проверка существования связанных записей (по btxid)
-        city = City.query.filter_by(btxid=city_id).first()
-        if not city:
+        # Проверка существования связанных записей (по btxid) через индекс кэша справочников
+        city_exists, object_city_id, category_exists, violation_category_ref = \
+            reference_cache.resolve_submission_refs(city_id, object_id, violation_category_id, violation_id)
+
+        if not city_exists:
             return jsonify({
                 'success': False,
                 'error': 'Invalid city_id'
             }), 400
 
-        obj = Object.query.filter_by(btxid=object_id).first()
-        if not obj or obj.city_id != city.id:
+        if object_city_id != city_id:
             return jsonify({
                 'success': False,
                 'error': 'Invalid object_id for selected city'
             }), 400
 
-        category = ViolationCategory.query.filter_by(btxid=violation_category_id).first()
-        if not category:
+        if not category_exists:
             return jsonify({
                 'success': False,
                 'error': 'Invalid violation_category_id'
             }), 400
 
-        violation = Violation.query.filter_by(btxid=violation_id).first()
-        if not violation or violation.category_id != category.id:
+        if violation_category_ref != violation_category_id:
             return jsonify({
                 'success': False,
                 'error': 'Invalid violation_id for selected category'
             }), 400
 
-        # Обработка загрузки файлов
+        # Обработка загрузки файлов (файлы уже приняты потоково в папку uploads, см. uploads.py)
         file_path = None
+        uploaded_files = []
         files = request.files.getlist('files') or request.files.getlist('file')
         files = [f for f in files if f and f.filename]
 
-        if files:
-            if len(files) > 5:
+        # Файлы, заранее загруженные по частям (идентификаторы завершённых сессий загрузки)
+        upload_sessions = []
+        tokens = data.getlist('file_tokens')
+        if len(set(tokens)) != len(tokens):
+            return jsonify({
+                'success': False,
+                'error': 'Duplicate file token'
+            }), 400
+        for token in tokens:
+            session = UploadSession.load(token)
+            if not session or not session.completed or session.telegram_user_id != telegram_user_id:
                 return jsonify({
                     'success': False,
-                    'error': 'Maximum 5 files are allowed'
+                    'error': 'Invalid file token'
                 }), 400
+            upload_sessions.append(session)
 
+        if len(files) + len(upload_sessions) > Config.MAX_FILES:
+            return jsonify({
+                'success': False,
+                'error': f'Maximum {Config.MAX_FILES} files are allowed'
+            }), 400
+
+        if files or upload_sessions:
             saved_files = []
             for file in files:
                 if not allowed_file(file.filename):
@@ -759,33 +1257,37 @@ def submit_form():
                         'error': 'Invalid file'
                     }), 400
 
-                # Проверка размера файла
-                file.seek(0, os.SEEK_END)
-                file_size = file.tell()
-                file.seek(0)
+                # Размер уже проверен при приёме (StreamedUpload прерывает разбор при превышении)
+                upload = file.stream
 
-                if file_size > Config.MAX_FILE_SIZE:
-                    return jsonify({
-                        'success': False,
-                        'error': f'File size exceeds maximum allowed size of {Config.MAX_FILE_SIZE / 1024 / 1024} MB'
-                    }), 400
-
-                # Сохранение файла
+                # Сохранение файла: переименование принятого файла внутри папки uploads
                 filename = secure_filename(file.filename)
                 # Добавляем timestamp для уникальности
-                import time
                 timestamp = int(time.time())
                 filename = f"{timestamp}_{filename}"
 
-                # Создаем папку uploads если её нет
-                os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
-
-                file_full_path = os.path.join(Config.UPLOAD_FOLDER, filename)
-                file.save(file_full_path)
+                upload.finalize(filename)
+                saved_files.append(filename)
+                uploaded_files.append({
+                    'name': filename,
+                    'size': upload.size,
+                    'sha256': upload.sha256
+                })
+                logger.info("submit_form: saved %s (%s bytes, sha256=%s)", filename, upload.size, upload.sha256)
+
+            for session in upload_sessions:
+                filename = f"{int(time.time())}_{secure_filename(session.filename)}"
+                session.consume(filename)
+                consumed_sessions.append((session, filename))
                 saved_files.append(filename)
+                uploaded_files.append({
+                    'name': filename,
+                    'size': session.size,
+                    'sha256': session.meta.get('sha256')
+                })
+                logger.info("submit_form: saved %s (%s bytes) from upload session", filename, session.size)
 
             # Сохраняем список файлов в БД
-            import json
             file_path = json.dumps(saved_files)
 
         # Создание записи (city_id хранит btxid города)
@@ -801,26 +1303,58 @@ def submit_form():
 
         db.session.add(submission)
         db.session.commit()
+        committed_sessions, consumed_sessions = consumed_sessions, []
+        for session, _ in committed_sessions:
+            try:
+                session.commit()
+            except OSError as e:
+                # Запись уже сохранена: оставшиеся файлы сессии удалит purge_expired
+                logger.warning("submit_form: could not remove upload session %s: %s", session.upload_id, e)
 
         return jsonify({
             'success': True,
             'message': 'Form submitted successfully',
-            'data': submission.to_dict()
+            'data': submission.to_dict(),
+            'files': uploaded_files
         }), 201
 
+    except UploadRejected as e:
+        restore_upload_sessions(consumed_sessions)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status_code
+    except RequestEntityTooLarge:
+        restore_upload_sessions(consumed_sessions)
+        # Превышен MAX_CONTENT_LENGTH (тело без Content-Length) или MAX_FORM_MEMORY_SIZE
+        return jsonify({
+            'success': False,
+            'error': 'Request is too large'
+        }), 413
     except ValueError as e:
+        restore_upload_sessions(consumed_sessions)
         return jsonify({
             'success': False,
             'error': f'Invalid data format: {str(e)}'
         }), 400
     except Exception as e:
         db.session.rollback()
+        restore_upload_sessions(consumed_sessions)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
+def restore_upload_sessions(consumed_sessions):
+    """Вернуть в сессии загрузки файлы несохранённой формы (клиент повторит отправку с теми же идентификаторами)"""
+    for session, filename in consumed_sessions:
+        try:
+            session.restore(filename)
+        except OSError as e:
+            logger.error("submit_form: could not restore upload session %s: %s", session.upload_id, e)
+
+
 @api.route('/users', methods=['GET'])
 def get_users():
     """Получить список всех пользователей (без секретных ключей)"""
@@ -877,6 +1411,7 @@ def create_user():
 
         db.session.add(user)
         db.session.commit()
+        authorized_users.invalidate()
 
         return jsonify({
             'success': True,
@@ -939,6 +1474,7 @@ def update_user(user_id):
             user.btxid = int(data.get('btxid')) if data.get('btxid') else None
 
         db.session.commit()
+        authorized_users.invalidate()
 
         return jsonify({
             'success': True,
@@ -972,21 +1508,13 @@ def check_user_access():
         if not tg_id:
             init_data = request.headers.get('X-Telegram-Init-Data')
             if init_data and Config.TELEGRAM_BOT_TOKEN:
-                if not validate_telegram_webapp_data(init_data, Config.TELEGRAM_BOT_TOKEN):
+                telegram_data = read_telegram_init_data(init_data)
+                if telegram_data is None:
                     return jsonify({
                         'success': False,
                         'error': 'Invalid Telegram WebApp data'
                     }), 401
-
-                try:
-                    from urllib.parse import parse_qs, unquote
-                    parsed_data = parse_qs(unquote(init_data))
-                    if 'user' in parsed_data:
-                        import json
-                        user_data = json.loads(parsed_data['user'][0])
-                        tg_id = user_data.get('id')
-                except:
-                    pass
+                tg_id = telegram_data.user_id
 
         if not tg_id:
             return jsonify({
@@ -994,7 +1522,8 @@ def check_user_access():
                 'error': 'tg_id is required'
             }), 400
 
-        user = User.query.filter_by(tg_id=int(tg_id)).first()
+        # Неизвестные tg_id отсекаются по кэшу, без запроса к БД
+        user = User.query.filter_by(tg_id=int(tg_id)).first() if authorized_users.contains(tg_id) else None
         if user:
             return jsonify({
                 'success': True,
@@ -1020,20 +1549,59 @@ def check_user_access():
         }), 500
 
 
+def parse_submissions_cursor(cursor):
+    """Разбор курсора вида '<created_at ISO>,<id>'"""
+    created_at, _, submission_id = cursor.rpartition(',')
+    return datetime.fromisoformat(created_at), int(submission_id)
+
+
 @api.route('/submissions', methods=['GET'])
 def get_submissions():
-    """Получить список отправленных форм (опционально, для администрирования)"""
+    """
+    Получить список отправленных форм (опционально, для администрирования)
+
+    Постраничный вывод по курсору: ?after=<created_at,id> из next_cursor предыдущей страницы.
+    Использует индекс (created_at, id), поэтому глубокие страницы не замедляются.
+    Фильтр ?telegram_user_id= — отправки одного пользователя (индекс (telegram_user_id, created_at)).
+    """
     try:
-        limit = request.args.get('limit', 50, type=int)
-        offset = request.args.get('offset', 0, type=int)
+        limit = max(1, min(request.args.get('limit', 50, type=int), 1000))
+        after = request.args.get('after')
+        
+        query = FormSubmission.query
+        telegram_user_id = request.args.get('telegram_user_id', type=int)
+        if telegram_user_id:
+            query = query.filter(FormSubmission.telegram_user_id == telegram_user_id)
+        if after:
+            created_at, submission_id = parse_submissions_cursor(after)
+            query = query.filter(or_(
+                FormSubmission.created_at < created_at,
+                and_(FormSubmission.created_at == created_at, FormSubmission.id < submission_id)
+            ))
+        else:
+            # Устаревший постраничный вывод через offset (оставлен для совместимости)
+            offset = request.args.get('offset', 0, type=int)
+            if offset:
+                query = query.offset(offset)
+        
+        submissions = query.order_by(FormSubmission.created_at.desc(), FormSubmission.id.desc()).limit(limit).all()
         
-        submissions = FormSubmission.query.order_by(FormSubmission.created_at.desc()).limit(limit).offset(offset).all()
+        next_cursor = None
+        if len(submissions) == limit:
+            last = submissions[-1]
+            next_cursor = f"{last.created_at.isoformat()},{last.id}"
         
         return jsonify({
             'success': True,
             'data': [sub.to_dict() for sub in submissions],
-            'count': len(submissions)
+            'count': len(submissions),
+            'next_cursor': next_cursor
         }), 200
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid cursor: {str(e)}'
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1041,6 +1609,97 @@ def get_submissions():
         }), 500
 
 
+class _EchoWriter:
+    """Файлоподобный объект для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+@api.route('/submissions/export', methods=['GET'])
+def export_submissions():
+    """
+    Потоковая выгрузка отправленных форм в NDJSON или CSV (для администрирования)
+
+    Параметры: format (ndjson по умолчанию или csv), date_from / date_to (ISO, date_to не включается),
+    city_id (btxid города). Строки читаются курсором на стороне сервера порциями, поэтому
+    память воркера не зависит от объёма выгрузки.
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson').lower()
+        if export_format not in ('ndjson', 'csv'):
+            return jsonify({
+                'success': False,
+                'error': 'format must be ndjson or csv'
+            }), 400
+
+        columns = list(FormSubmission.__table__.columns)
+        stmt = select(*columns).order_by(FormSubmission.created_at, FormSubmission.id)
+
+        date_from = request.args.get('date_from')
+        if date_from:
+            stmt = stmt.where(FormSubmission.created_at >= datetime.fromisoformat(date_from))
+        date_to = request.args.get('date_to')
+        if date_to:
+            stmt = stmt.where(FormSubmission.created_at < datetime.fromisoformat(date_to))
+        city_id = request.args.get('city_id', type=int)
+        if city_id:
+            stmt = stmt.where(FormSubmission.city_id == city_id)
+
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid data format: {str(e)}'
+        }), 400
+
+    column_names = [column.name for column in columns]
+
+    def generate_rows():
+        rows = db.session.execute(stmt.execution_options(yield_per=1000))
+        for row in rows:
+            values = dict(zip(column_names, row))
+            if values['created_at'] is not None:
+                values['created_at'] = values['created_at'].isoformat()
+            yield values
+
+    def generate_ndjson():
+        for values in generate_rows():
+            yield json.dumps(values, ensure_ascii=False) + '\n'
+
+    def generate_csv():
+        writer = csv.writer(_EchoWriter())
+        yield writer.writerow(column_names)
+        for values in generate_rows():
+            yield writer.writerow([values[name] for name in column_names])
+
+    if export_format == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=submissions.{export_format}'}
+    )
+
+
+@api.route('/db-pool', methods=['GET'])
+def get_db_pool_stats():
+    """Состояние пула соединений с БД текущего процесса (для подбора DB_POOL_SIZE)"""
+    return jsonify({
+        'success': True,
+        'data': pool_stats.snapshot()
+    }), 200
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Метрики в формате Prometheus (суммарно по всем воркерам gunicorn)"""
+    payload, content_type = metrics_payload()
+    return Response(payload, content_type=content_type)
+
+
 @api.route('/uploads/<filename>', methods=['GET'])
 def download_file(filename):
     """Скачать загруженный файл"""
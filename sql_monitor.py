@@ -0,0 +1,77 @@
+"""
+Учёт SQL-запросов через события SQLAlchemy (before/after_cursor_execute).
+
+Для каждого запроса к приложению считаются число SQL-запросов и суммарное
+время в БД (query_stats()); запросы дольше SLOW_QUERY_MS пишутся в лог с
+именем endpoint. Итоги запроса попадают в метрики db_queries_per_request /
+db_time_per_request_seconds, а при SQL_TIMING_HEADER=true — в заголовки
+ответа X-DB-Query-Count и Server-Timing (для тестов и отладки).
+"""
+import logging
+import time
+
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy import event
+
+from config import Config
+from metrics import DB_QUERIES_PER_REQUEST, DB_QUERY_DURATION, DB_TIME_PER_REQUEST
+
+logger = logging.getLogger(__name__)
+
+
+def install_query_monitor(engine):
+    """Подключить учёт запросов к engine"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started_at'].pop()
+        DB_QUERY_DURATION.observe(elapsed)
+
+        if has_app_context():
+            g.sql_query_count = g.get('sql_query_count', 0) + 1
+            g.sql_query_time = g.get('sql_query_time', 0.0) + elapsed
+
+        if elapsed * 1000 >= Config.SLOW_QUERY_MS:
+            endpoint = request.endpoint if has_request_context() else None
+            logger.warning(
+                "slow query %.1f ms [%s]: %s",
+                elapsed * 1000, endpoint or '-', statement[:Config.SLOW_QUERY_LOG_LENGTH]
+            )
+
+    @event.listens_for(engine, 'handle_error')
+    def _handle_error(exception_context):
+        # after_cursor_execute не вызывается для запроса с ошибкой
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_started_at'):
+            conn.info['query_started_at'].pop()
+
+
+def query_stats():
+    """(число SQL-запросов, время в БД в секундах) в рамках текущего запроса / контекста приложения"""
+    return g.get('sql_query_count', 0), g.get('sql_query_time', 0.0)
+
+
+def _add_timing_headers(response):
+    count, seconds = query_stats()
+    response.headers['X-DB-Query-Count'] = str(count)
+    response.headers['Server-Timing'] = f'db;dur={seconds * 1000:.1f};desc="{count} queries"'
+    return response
+
+
+def _record_request_stats(exc):
+    if request.endpoint is None:
+        return
+    count, seconds = query_stats()
+    DB_QUERIES_PER_REQUEST.labels(request.endpoint).observe(count)
+    DB_TIME_PER_REQUEST.labels(request.endpoint).observe(seconds)
+
+
+def init_app(app):
+    """Итоги по SQL-запросам для каждого запроса приложения"""
+    if Config.SQL_TIMING_HEADER:
+        app.after_request(_add_timing_headers)
+    app.teardown_request(_record_request_stats)
@@ -6,53 +6,220 @@ tg.expand();
 // API базовый URL
 const API_BASE = '/api';
 
+// Файлы больше этого размера загружаются по частям с докачкой после обрыва связи
+const RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024;
+const UPLOAD_RETRY_LIMIT = 5;
+
+// Загрузки по частям до успешной отправки формы: выбранный File -> { keepOriginals, file, uploadId, completed }.
+// При повторной отправке сессии продолжаются, а завершённые загрузки не повторяются
+const pendingUploads = new Map();
+
 // Состояние формы
 let cities = [];
 let objects = [];
 let violationCategories = [];
 let violations = [];
 
-// Проверка авторизации при загрузке страницы
-document.addEventListener('DOMContentLoaded', async function() {
-    // Проверяем, авторизован ли пользователь
-    if (tg.initData) {
-        try {
-            const response = await fetch(`${API_BASE}/users/check-access`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-Telegram-Init-Data': tg.initData
-                },
-                body: JSON.stringify({})
-            });
+// Справочники из /api/bootstrap: объекты и нарушения сгруппированы по btxid родителя
+let objectsByCity = null;
+let violationsByCategory = null;
 
-            const result = await response.json();
+// Справочники с версией из /api/bootstrap сохраняются между запусками WebApp
+const REFERENCE_CACHE_KEY = 'miniapp.referenceData';
 
-            if (!result.success || !result.authorized) {
-                // Пользователь не авторизован, показываем сообщение об ошибке
-                showMessage('Доступ запрещен: Пользователь не зарегистрирован в системе', 'error');
-                // Блокируем всю форму
-                document.querySelectorAll('select, textarea, input, button').forEach(element => {
-                    element.disabled = true;
-                });
-                // Также закрываем приложение через Telegram WebApp
-                setTimeout(() => {
-                    if (tg.close) {
-                        tg.close();
-                    }
-                }, 3000); // Закрытие через 3 секунды после отображения ошибки
-                return;
-            }
-        } catch (error) {
-            console.error('Error checking user access:', error);
+// Начальная загрузка: форма заполняется из сохранённых справочников, затем
+// /api/bootstrap проверяет доступ и присылает справочники, только если версия изменилась
+document.addEventListener('DOMContentLoaded', async function() {
+    const cached = readReferenceCache();
+    if (cached) {
+        applyReferenceData(cached.data);
+        setupFormHandlers();
+    }
+
+    let bootstrap = null;
+    try {
+        const headers = {};
+        if (tg.initData) {
+            headers['X-Telegram-Init-Data'] = tg.initData;
         }
+        const query = cached ? `?version=${encodeURIComponent(cached.version)}` : '';
+        const response = await fetch(`${API_BASE}/bootstrap${query}`, { headers });
+        bootstrap = await response.json();
+    } catch (error) {
+        console.error('Error loading bootstrap data:', error);
     }
 
-    loadCities();
-    loadViolationCategories();
-    setupFormHandlers();
+    // Пользователь не авторизован (или initData не прошли проверку)
+    if (tg.initData && bootstrap && (!bootstrap.success || bootstrap.access.authorized === false)) {
+        clearReferenceCache();
+        denyAccess();
+        return;
+    }
+
+    if (bootstrap && bootstrap.success && bootstrap.data) {
+        applyReferenceData(bootstrap.data);
+        writeReferenceCache(bootstrap.version, bootstrap.data);
+    } else if (!cached) {
+        // Запасной вариант: отдельные запросы справочников
+        loadCities();
+        loadViolationCategories();
+    }
+    if (!cached) {
+        setupFormHandlers();
+    }
 });
 
+// Сохранённые справочники: { version, data } или null
+function readReferenceCache() {
+    try {
+        const cached = JSON.parse(localStorage.getItem(REFERENCE_CACHE_KEY));
+        return cached && cached.version && cached.data ? cached : null;
+    } catch (error) {
+        return null;
+    }
+}
+
+function writeReferenceCache(version, data) {
+    try {
+        localStorage.setItem(REFERENCE_CACHE_KEY, JSON.stringify({ version, data }));
+    } catch (error) {
+        // Хранилище недоступно или переполнено — справочники просто не сохраняются
+        console.error('Error saving reference data:', error);
+    }
+}
+
+function clearReferenceCache() {
+    try {
+        localStorage.removeItem(REFERENCE_CACHE_KEY);
+    } catch (error) {
+        // Хранилище недоступно
+    }
+}
+
+// Блокировка формы для неавторизованного пользователя
+function denyAccess() {
+    showMessage('Доступ запрещен: Пользователь не зарегистрирован в системе', 'error');
+    // Блокируем всю форму
+    document.querySelectorAll('select, textarea, input, button').forEach(element => {
+        element.disabled = true;
+    });
+    // Также закрываем приложение через Telegram WebApp
+    setTimeout(() => {
+        if (tg.close) {
+            tg.close();
+        }
+    }, 3000); // Закрытие через 3 секунды после отображения ошибки
+}
+
+// Применение справочников из /api/bootstrap (или сохранённой копии).
+// Выбор пользователя сохраняется, если выбранные значения остались в справочниках
+function applyReferenceData(data) {
+    const selected = {};
+    ['city', 'object', 'violationCategory', 'violation'].forEach(id => {
+        selected[id] = document.getElementById(id).value;
+    });
+
+    objectsByCity = data.objects;
+    violationsByCategory = data.violations;
+    renderCities(data.cities);
+    renderViolationCategories(data.violation_categories);
+
+    if (restoreSelection('city', selected.city)) {
+        renderObjects(objectsByCity[selected.city] || []);
+        restoreSelection('object', selected.object);
+    } else if (selected.city) {
+        resetSelect('object', 'Сначала выберите город');
+    }
+    if (restoreSelection('violationCategory', selected.violationCategory)) {
+        renderViolations(violationsByCategory[selected.violationCategory] || []);
+        restoreSelection('violation', selected.violation);
+    } else if (selected.violationCategory) {
+        resetSelect('violation', 'Сначала выберите категорию');
+    }
+}
+
+function resetSelect(id, placeholder) {
+    const select = document.getElementById(id);
+    select.disabled = true;
+    select.innerHTML = `<option value="">${placeholder}</option>`;
+}
+
+// Выбрать значение в списке, если оно в нём есть
+function restoreSelection(id, value) {
+    const select = document.getElementById(id);
+    if (!value || !Array.from(select.options).some(option => option.value === value)) {
+        return false;
+    }
+    select.value = value;
+    return true;
+}
+
+// Заполнение списка городов
+function renderCities(list) {
+    cities = list;
+    const citySelect = document.getElementById('city');
+    citySelect.innerHTML = '<option value="">Выберите город</option>';
+    // В форме city_id — это btxid города (для form_submissions)
+    cities.filter(city => city.btxid != null).forEach(city => {
+        const option = document.createElement('option');
+        option.value = city.btxid;
+        option.textContent = city.name;
+        citySelect.appendChild(option);
+    });
+}
+
+// Заполнение списка объектов
+function renderObjects(list) {
+    const objectSelect = document.getElementById('object');
+    objects = list;
+    objectSelect.innerHTML = '<option value="">Выберите объект</option>';
+
+    if (objects.length === 0) {
+        objectSelect.innerHTML = '<option value="">Нет объектов для выбранного города</option>';
+    } else {
+        objects.filter(obj => obj.btxid != null).forEach(obj => {
+            const option = document.createElement('option');
+            option.value = obj.btxid;
+            option.textContent = obj.name;
+            objectSelect.appendChild(option);
+        });
+        objectSelect.disabled = false;
+    }
+}
+
+// Заполнение списка категорий нарушений
+function renderViolationCategories(list) {
+    violationCategories = list;
+    const categorySelect = document.getElementById('violationCategory');
+    categorySelect.innerHTML = '<option value="">Выберите категорию</option>';
+
+    violationCategories.filter(cat => cat.btxid != null).forEach(cat => {
+        const option = document.createElement('option');
+        option.value = cat.btxid;
+        option.textContent = cat.name;
+        categorySelect.appendChild(option);
+    });
+}
+
+// Заполнение списка нарушений
+function renderViolations(list) {
+    const violationSelect = document.getElementById('violation');
+    violations = list;
+    violationSelect.innerHTML = '<option value="">Выберите нарушение</option>';
+
+    if (violations.length === 0) {
+        violationSelect.innerHTML = '<option value="">Нет нарушений для выбранной категории</option>';
+    } else {
+        violations.filter(viol => viol.btxid != null).forEach(viol => {
+            const option = document.createElement('option');
+            option.value = viol.btxid;
+            option.textContent = viol.name;
+            violationSelect.appendChild(option);
+        });
+        violationSelect.disabled = false;
+    }
+}
+
 // Загрузка городов
 async function loadCities() {
     try {
@@ -60,16 +227,7 @@ async function loadCities() {
         const result = await response.json();
         
         if (result.success) {
-            cities = result.data;
-            const citySelect = document.getElementById('city');
-            citySelect.innerHTML = '<option value="">Выберите город</option>';
-            // В форме city_id — это btxid города (для form_submissions)
-            cities.filter(city => city.btxid != null).forEach(city => {
-                const option = document.createElement('option');
-                option.value = city.btxid;
-                option.textContent = city.name;
-                citySelect.appendChild(option);
-            });
+            renderCities(result.data);
         } else {
             showMessage('Ошибка загрузки городов: ' + result.error, 'error');
         }
@@ -83,6 +241,13 @@ async function loadCities() {
 async function loadObjects(cityId) {
     const objectSelect = document.getElementById('object');
     objectSelect.disabled = true;
+
+    // Объекты уже получены через /api/bootstrap — запрос не нужен
+    if (objectsByCity) {
+        renderObjects(objectsByCity[cityId] || []);
+        return;
+    }
+
     objectSelect.innerHTML = '<option value="">Загрузка...</option>';
     
     try {
@@ -90,20 +255,7 @@ async function loadObjects(cityId) {
         const result = await response.json();
         
         if (result.success) {
-            objects = result.data;
-            objectSelect.innerHTML = '<option value="">Выберите объект</option>';
-            
-            if (objects.length === 0) {
-                objectSelect.innerHTML = '<option value="">Нет объектов для выбранного города</option>';
-            } else {
-                objects.filter(obj => obj.btxid != null).forEach(obj => {
-                    const option = document.createElement('option');
-                    option.value = obj.btxid;
-                    option.textContent = obj.name;
-                    objectSelect.appendChild(option);
-                });
-                objectSelect.disabled = false;
-            }
+            renderObjects(result.data);
         } else {
             objectSelect.innerHTML = '<option value="">Ошибка загрузки объектов</option>';
             showMessage('Ошибка загрузки объектов: ' + result.error, 'error');
@@ -122,16 +274,7 @@ async function loadViolationCategories() {
         const result = await response.json();
         
         if (result.success) {
-            violationCategories = result.data;
-            const categorySelect = document.getElementById('violationCategory');
-            categorySelect.innerHTML = '<option value="">Выберите категорию</option>';
-            
-            violationCategories.filter(cat => cat.btxid != null).forEach(cat => {
-                const option = document.createElement('option');
-                option.value = cat.btxid;
-                option.textContent = cat.name;
-                categorySelect.appendChild(option);
-            });
+            renderViolationCategories(result.data);
         } else {
             showMessage('Ошибка загрузки категорий: ' + result.error, 'error');
         }
@@ -145,6 +288,13 @@ async function loadViolationCategories() {
 async function loadViolations(categoryId) {
     const violationSelect = document.getElementById('violation');
     violationSelect.disabled = true;
+
+    // Нарушения уже получены через /api/bootstrap — запрос не нужен
+    if (violationsByCategory) {
+        renderViolations(violationsByCategory[categoryId] || []);
+        return;
+    }
+
     violationSelect.innerHTML = '<option value="">Загрузка...</option>';
     
     try {
@@ -152,20 +302,7 @@ async function loadViolations(categoryId) {
         const result = await response.json();
         
         if (result.success) {
-            violations = result.data;
-            violationSelect.innerHTML = '<option value="">Выберите нарушение</option>';
-            
-            if (violations.length === 0) {
-                violationSelect.innerHTML = '<option value="">Нет нарушений для выбранной категории</option>';
-            } else {
-                violations.filter(viol => viol.btxid != null).forEach(viol => {
-                    const option = document.createElement('option');
-                    option.value = viol.btxid;
-                    option.textContent = viol.name;
-                    violationSelect.appendChild(option);
-                });
-                violationSelect.disabled = false;
-            }
+            renderViolations(result.data);
         } else {
             violationSelect.innerHTML = '<option value="">Ошибка загрузки нарушений</option>';
             showMessage('Ошибка загрузки нарушений: ' + result.error, 'error');
@@ -300,7 +437,7 @@ async function submitForm() {
     submitLoader.style.display = 'inline-block';
     
     try {
-        const formData = new FormData(form);
+        const formData = await buildSubmitFormData(form);
         
         // Добавляем Telegram initData если доступен
         if (tg.initData) {
@@ -317,6 +454,7 @@ async function submitForm() {
             
             if (result.success) {
                 showMessage('Данные успешно отправлены!', 'success');
+                pendingUploads.clear();
                 form.reset();
                 
                 // Сброс зависимых полей
@@ -330,6 +468,7 @@ async function submitForm() {
                     tg.HapticFeedback.notificationOccurred('success');
                 }
             } else {
+                forgetExpiredUploads(result.error);
                 showMessage('Ошибка: ' + result.error, 'error');
                 if (tg.HapticFeedback) {
                     tg.HapticFeedback.notificationOccurred('error');
@@ -346,6 +485,7 @@ async function submitForm() {
             
             if (result.success) {
                 showMessage('Данные успешно отправлены!', 'success');
+                pendingUploads.clear();
                 form.reset();
                 
                 document.getElementById('object').disabled = true;
@@ -353,6 +493,7 @@ async function submitForm() {
                 document.getElementById('violation').disabled = true;
                 document.getElementById('violation').innerHTML = '<option value="">Сначала выберите категорию</option>';
             } else {
+                forgetExpiredUploads(result.error);
                 showMessage('Ошибка: ' + result.error, 'error');
             }
         }
@@ -370,6 +511,217 @@ async function submitForm() {
     }
 }
 
+// Сервер не принял идентификаторы загрузок (сессии удалены) — при повторной отправке файлы загрузятся заново
+function forgetExpiredUploads(error) {
+    if (error === 'Invalid file token') {
+        pendingUploads.clear();
+    }
+}
+
+// Заголовки запроса с Telegram initData (если доступен)
+function telegramHeaders(headers = {}) {
+    if (tg.initData) {
+        headers['X-Telegram-Init-Data'] = tg.initData;
+    }
+    return headers;
+}
+
+// Данные формы: фото уменьшаются (если не выбрано «в исходном размере»),
+// большие файлы заменяются идентификаторами загруженных по частям файлов
+async function buildSubmitFormData(form) {
+    const formData = new FormData(form);
+    const files = formData.getAll('files');
+    formData.delete('files');
+    const keepOriginals = document.getElementById('keepOriginals').checked;
+
+    for (const original of files) {
+        if (!(original instanceof File) || !original.name) {
+            continue;
+        }
+        let pending = pendingUploads.get(original);
+        if (pending && pending.keepOriginals !== keepOriginals) {
+            pendingUploads.delete(original);
+            pending = null;
+        }
+        // Фото обрабатываются по одному: на телефоне несколько декодированных снимков не помещаются в память
+        const file = pending ? pending.file : (keepOriginals ? original : await downscaleImage(form, original));
+        if (file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+            if (!pending) {
+                pending = { keepOriginals, file, uploadId: null, completed: false };
+                pendingUploads.set(original, pending);
+            }
+            formData.append('file_tokens', await uploadFileResumable(pending));
+        } else {
+            formData.append('files', file);
+        }
+    }
+    return formData;
+}
+
+// Фото, которые уменьшаются перед загрузкой (GIF не трогаем — может быть анимацией)
+const DOWNSCALE_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/webp'];
+
+let imageWorker = null;
+const imageWorkerRequests = new Map();
+let imageWorkerNextId = 0;
+
+function imageDownscaleSupported() {
+    return typeof Worker !== 'undefined' && typeof OffscreenCanvas !== 'undefined'
+        && typeof createImageBitmap !== 'undefined' && 'convertToBlob' in OffscreenCanvas.prototype;
+}
+
+// Фото, уменьшенное до data-image-max-edge и пережатое в воркере; исходный файл,
+// если уменьшать не нужно, браузер этого не умеет или обработка не удалась
+async function downscaleImage(form, file) {
+    const maxEdge = parseInt(form.dataset.imageMaxEdge, 10);
+    if (!maxEdge || !DOWNSCALE_IMAGE_TYPES.includes(file.type) || !imageDownscaleSupported()) {
+        return file;
+    }
+
+    if (!imageWorker) {
+        imageWorker = new Worker(form.dataset.imageWorker);
+        imageWorker.onmessage = event => {
+            const resolve = imageWorkerRequests.get(event.data.id);
+            imageWorkerRequests.delete(event.data.id);
+            resolve(event.data);
+        };
+        // Воркер не загрузился — ожидающие фото отправляются как есть
+        imageWorker.onerror = event => {
+            event.preventDefault();
+            imageWorkerRequests.forEach(resolve => resolve({ error: event.message || 'image worker failed' }));
+            imageWorkerRequests.clear();
+            imageWorker.terminate();
+            imageWorker = null;
+        };
+    }
+
+    const id = imageWorkerNextId++;
+    const result = await new Promise(resolve => {
+        imageWorkerRequests.set(id, resolve);
+        imageWorker.postMessage({
+            id,
+            file,
+            maxEdge,
+            quality: parseFloat(form.dataset.imageQuality),
+            type: form.dataset.imageFormat
+        });
+    });
+
+    if (result.error) {
+        console.error('Error downscaling image:', result.error);
+    }
+    if (!result.blob) {
+        return file;
+    }
+    const extension = result.blob.type === 'image/webp' ? 'webp' : 'jpg';
+    const name = file.name.replace(/\.[^.]*$/, '') + '.' + extension;
+    return new File([result.blob], name, { type: result.blob.type, lastModified: file.lastModified });
+}
+
+// Загрузка файла по частям; после обрыва связи досылаются только недостающие байты.
+// pending — запись pendingUploads: повторная отправка формы продолжает ту же сессию
+// загрузки, а уже завершённая загрузка не повторяется
+async function uploadFileResumable(pending) {
+    const file = pending.file;
+    if (pending.completed) {
+        return pending.uploadId;
+    }
+
+    let response;
+    let result;
+    let offset = 0;
+    let chunkSize = null;
+
+    if (pending.uploadId) {
+        response = await fetch(`${API_BASE}/upload-sessions/${pending.uploadId}`, { headers: telegramHeaders() });
+        result = await response.json();
+        if (response.status === 404) {
+            // Сессия удалена на сервере (истёк срок) — загружаем файл заново
+            pending.uploadId = null;
+        } else if (!result.success) {
+            throw new Error(result.error);
+        } else if (result.data.completed) {
+            pending.completed = true;
+            return pending.uploadId;
+        } else {
+            offset = result.data.offset;
+            chunkSize = result.data.chunk_size;
+        }
+    }
+
+    if (!pending.uploadId) {
+        response = await fetch(`${API_BASE}/upload-sessions`, {
+            method: 'POST',
+            headers: telegramHeaders({ 'Content-Type': 'application/json' }),
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        result = await response.json();
+        if (!result.success) {
+            throw new Error(result.error);
+        }
+        pending.uploadId = result.data.upload_id;
+        offset = result.data.offset;
+        chunkSize = result.data.chunk_size;
+    }
+
+    const uploadId = pending.uploadId;
+    let failures = 0;
+
+    while (offset < file.size) {
+        try {
+            response = await fetch(`${API_BASE}/upload-sessions/${uploadId}?offset=${offset}`, {
+                method: 'PUT',
+                headers: telegramHeaders({ 'Content-Type': 'application/octet-stream' }),
+                body: file.slice(offset, offset + chunkSize)
+            });
+            result = await response.json();
+            // При 409 сервер возвращает фактически полученное смещение
+            if (!result.success && response.status !== 409) {
+                throw new Error(result.error);
+            }
+            offset = result.data.offset;
+            failures = 0;
+        } catch (error) {
+            failures += 1;
+            if (failures > UPLOAD_RETRY_LIMIT) {
+                // Сессия сохраняется: следующая отправка формы продолжит с полученного сервером места
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            // Узнаём, сколько байт сервер уже получил, и продолжаем с этого места
+            let status = null;
+            try {
+                response = await fetch(`${API_BASE}/upload-sessions/${uploadId}`, { headers: telegramHeaders() });
+                status = response.status;
+                result = await response.json();
+                if (result.success) {
+                    offset = result.data.offset;
+                }
+            } catch (statusError) {
+                console.error('Error checking upload status:', statusError);
+            }
+            if (status === 404) {
+                pending.uploadId = null;
+                throw new Error('Upload session not found');
+            }
+        }
+    }
+
+    response = await fetch(`${API_BASE}/upload-sessions/${uploadId}/finalize`, {
+        method: 'POST',
+        headers: telegramHeaders()
+    });
+    result = await response.json();
+    if (response.status === 404) {
+        pending.uploadId = null;
+    }
+    if (!result.success) {
+        throw new Error(result.error);
+    }
+    pending.completed = true;
+    return uploadId;
+}
+
 // Показать сообщение
 function showMessage(text, type) {
     const messageEl = document.getElementById('message');
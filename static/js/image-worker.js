@@ -0,0 +1,33 @@
+// Уменьшение и пережатие фото перед загрузкой (вне основного потока страницы).
+// Сообщение: { id, file, maxEdge, quality, type }.
+// Ответ: { id, blob } — blob равен null, если фото не нужно менять (уже не больше maxEdge
+// или пережатый файл не меньше исходного); { id, error } — фото не удалось обработать.
+self.onmessage = async function(event) {
+    const { id, file, maxEdge, quality, type } = event.data;
+    try {
+        const bitmap = await createImageBitmap(file, { imageOrientation: 'from-image' });
+        const scale = Math.min(1, maxEdge / Math.max(bitmap.width, bitmap.height));
+        if (scale === 1) {
+            bitmap.close();
+            self.postMessage({ id, blob: null });
+            return;
+        }
+
+        const width = Math.round(bitmap.width * scale);
+        const height = Math.round(bitmap.height * scale);
+        const canvas = new OffscreenCanvas(width, height);
+        const context = canvas.getContext('2d');
+        context.imageSmoothingQuality = 'high';
+        context.drawImage(bitmap, 0, 0, width, height);
+        bitmap.close();
+
+        let blob = await canvas.convertToBlob({ type, quality });
+        // Браузер без кодировщика WebP возвращает PNG — тогда пережимаем в JPEG
+        if (blob.type !== type) {
+            blob = await canvas.convertToBlob({ type: 'image/jpeg', quality });
+        }
+        self.postMessage({ id, blob: blob.size < file.size ? blob : null });
+    } catch (error) {
+        self.postMessage({ id, error: String(error) });
+    }
+};
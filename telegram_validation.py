@@ -1,55 +1,153 @@
 import hashlib
 import hmac
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, NamedTuple, Optional
 from urllib.parse import parse_qs, unquote
 
+logger = logging.getLogger(__name__)
 
-def validate_telegram_webapp_data(init_data: str, bot_token: str) -> bool:
+
+class TelegramInitData(NamedTuple):
+    """Разобранные данные Telegram WebApp initData"""
+    fields: Dict[str, str]
+    user: Optional[dict]
+    auth_date: Optional[int]
+
+    @property
+    def user_id(self) -> Optional[int]:
+        return self.user.get('id') if self.user else None
+
+
+def parse_telegram_webapp_data(init_data: str) -> TelegramInitData:
     """
-    Валидация данных Telegram WebApp
-    
+    Разбор строки initData без проверки подписи
+
     Args:
         init_data: Строка initData из Telegram WebApp
-        bot_token: Токен Telegram бота
-    
+
     Returns:
-        True если данные валидны, False в противном случае
+        TelegramInitData (user равен None, если поле отсутствует или не является JSON)
     """
+    parsed_data = parse_qs(unquote(init_data))
+    fields = {key: values[0] for key, values in parsed_data.items()}
+
+    user = None
+    if 'user' in fields:
+        try:
+            user = json.loads(fields['user'])
+        except ValueError:
+            user = None
+        if not isinstance(user, dict):
+            user = None
+
     try:
-        # Парсим данные
-        parsed_data = parse_qs(unquote(init_data))
-        
-        # Извлекаем hash и остальные данные
-        received_hash = parsed_data.get('hash', [None])[0]
-        if not received_hash:
-            return False
-        
-        # Удаляем hash из данных для проверки
-        data_check_string = []
-        for key in sorted(parsed_data.keys()):
-            if key != 'hash':
-                data_check_string.append(f"{key}={parsed_data[key][0]}")
-        
-        data_check_string = '\n'.join(data_check_string)
-        
-        # Создаем секретный ключ
-        secret_key = hmac.new(
+        auth_date = int(fields['auth_date']) if 'auth_date' in fields else None
+    except ValueError:
+        auth_date = None
+
+    return TelegramInitData(fields=fields, user=user, auth_date=auth_date)
+
+
+class TelegramWebAppValidator:
+    """
+    Проверка подписи Telegram WebApp initData для одного бота
+
+    Секретный ключ HMAC("WebAppData", bot_token) вычисляется один раз при создании.
+    Успешно проверенные initData хранятся в ограниченном LRU-кэше с TTL, поэтому
+    повторные запросы из той же сессии WebApp не пересчитывают HMAC и не разбирают данные.
+    """
+
+    def __init__(self, bot_token: str, cache_size: int = 1024, cache_ttl: int = 300):
+        self.secret_key = hmac.new(
             key=b"WebAppData",
             msg=bot_token.encode('utf-8'),
             digestmod=hashlib.sha256
         ).digest()
-        
-        # Вычисляем hash
-        calculated_hash = hmac.new(
-            key=secret_key,
-            msg=data_check_string.encode('utf-8'),
-            digestmod=hashlib.sha256
-        ).hexdigest()
-        
-        # Сравниваем hash
-        return calculated_hash == received_hash
-        
-    except Exception as e:
-        print(f"Error validating Telegram data: {e}")
-        return False
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def validate(self, init_data: str) -> Optional[TelegramInitData]:
+        """
+        Проверка и разбор initData
+
+        Returns:
+            TelegramInitData если подпись верна, None в противном случае
+        """
+        # Ключ кэша — хэш всей строки, а не поле hash: иначе подменённые данные
+        # с чужим hash попали бы в кэш как проверенные
+        cache_key = hashlib.sha256(init_data.encode('utf-8')).digest()
+        now = time.monotonic()
 
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                expires_at, result = cached
+                if expires_at > now:
+                    self._cache.move_to_end(cache_key)
+                    return result
+                del self._cache[cache_key]
 
+        result = self._validate(init_data)
+        if result is not None and self.cache_size > 0:
+            with self._lock:
+                self._cache[cache_key] = (now + self.cache_ttl, result)
+                self._cache.move_to_end(cache_key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def _validate(self, init_data: str) -> Optional[TelegramInitData]:
+        try:
+            result = parse_telegram_webapp_data(init_data)
+
+            # Извлекаем hash и остальные данные
+            received_hash = result.fields.get('hash')
+            if not received_hash:
+                return None
+
+            # Удаляем hash из данных для проверки
+            data_check_string = '\n'.join(
+                f"{key}={result.fields[key]}" for key in sorted(result.fields) if key != 'hash'
+            )
+
+            # Вычисляем hash
+            calculated_hash = hmac.new(
+                key=self.secret_key,
+                msg=data_check_string.encode('utf-8'),
+                digestmod=hashlib.sha256
+            ).hexdigest()
+
+            if not hmac.compare_digest(calculated_hash, received_hash):
+                return None
+            return result
+
+        except Exception as e:
+            logger.warning("Error validating Telegram data: %s", e)
+            return None
+
+
+@lru_cache(maxsize=None)
+def get_validator(bot_token: str, cache_size: int = 1024, cache_ttl: int = 300) -> TelegramWebAppValidator:
+    """Валидатор для токена бота (один экземпляр на процесс)"""
+    return TelegramWebAppValidator(bot_token, cache_size=cache_size, cache_ttl=cache_ttl)
+
+
+def validate_telegram_webapp_data(init_data: str, bot_token: str) -> bool:
+    """
+    Валидация данных Telegram WebApp
+
+    Args:
+        init_data: Строка initData из Telegram WebApp
+        bot_token: Токен Telegram бота
+
+    Returns:
+        True если данные валидны, False в противном случае
+    """
+    return get_validator(bot_token).validate(init_data) is not None
@@ -0,0 +1,309 @@
+"""
+Потоковый приём загружаемых файлов.
+
+По умолчанию Werkzeug складывает каждую часть multipart во временный файл,
+после чего обработчик копирует её в uploads — каждый байт пишется дважды.
+Для endpoints из StreamingUploadRequest.streaming_upload_endpoints части
+пишутся сразу в Config.UPLOAD_FOLDER (во временное имя .part): размер
+проверяется по мере приёма, sha256 считается на лету, а сохранение файла —
+это переименование внутри той же папки.
+
+Большие файлы (видеофиксация) можно загружать по частям через сессии загрузки
+(UploadSession): части сохраняются в UPLOAD_FOLDER/.sessions, и после обрыва
+связи клиент досылает только недостающие байты, а в /api/submit передаёт
+идентификатор завершённой сессии вместо самого файла.
+"""
+import hashlib
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+
+from flask import Request
+from werkzeug.utils import cached_property
+
+from config import Config
+from metrics import UPLOAD_BYTES
+
+
+class UploadRejected(Exception):
+    """Загрузка отклонена во время приёма тела запроса (превышен лимит)"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StreamedUpload:
+    """Файл загрузки, записываемый напрямую в папку uploads"""
+
+    def __init__(self, directory, max_size=None):
+        fd, self.path = tempfile.mkstemp(prefix='.upload-', suffix='.part', dir=directory)
+        self._file = os.fdopen(fd, 'w+b')
+        self._hash = hashlib.sha256()
+        self.directory = directory
+        self.max_size = max_size
+        self.size = 0
+        self.filename = None
+        self.finalized = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_size is not None and self.size > self.max_size:
+            # Прерываем разбор запроса, не дочитывая оставшееся тело
+            raise UploadRejected(
+                f'File size exceeds maximum allowed size of {self.max_size / 1024 / 1024} MB'
+            )
+        self._hash.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        """sha256 содержимого (hex), вычисленный при приёме"""
+        return self._hash.hexdigest()
+
+    def finalize(self, filename):
+        """Переместить принятый файл под окончательным именем (в той же папке)"""
+        UPLOAD_BYTES.labels('form').inc(self.size)
+        self._file.close()
+        final_path = os.path.join(self.directory, filename)
+        os.replace(self.path, final_path)
+        self.path = final_path
+        self.finalized = True
+        return final_path
+
+    def discard(self):
+        """Удалить не сохранённый файл"""
+        UPLOAD_BYTES.labels('form').inc(self.size)
+        self._file.close()
+        if not self.finalized and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush и т.п. — от открытого файла
+        return getattr(self._file, name)
+
+
+class StreamingUploadRequest(Request):
+    """Request, который для выбранных endpoints пишет файлы multipart сразу в uploads"""
+
+    streaming_upload_endpoints = {'api.submit_form'}
+    # Лимит нефайловых частей multipart (по умолчанию в Werkzeug — 500 КБ)
+    max_form_memory_size = Config.MAX_FORM_MEMORY_SIZE
+
+    @cached_property
+    def streamed_uploads(self):
+        """Файлы, принятые потоково в рамках текущего запроса"""
+        return []
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.endpoint not in self.streaming_upload_endpoints:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+        if filename and sum(1 for u in self.streamed_uploads if u.filename) >= Config.MAX_FILES:
+            # Лишний файл — прерываем разбор, не принимая его содержимое
+            raise UploadRejected(f'Maximum {Config.MAX_FILES} files are allowed')
+
+        os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        upload = StreamedUpload(Config.UPLOAD_FOLDER, Config.MAX_FILE_SIZE)
+        upload.filename = filename
+        self.streamed_uploads.append(upload)
+        return upload
+
+    def discard_streamed_uploads(self):
+        """Удалить принятые, но не сохранённые обработчиком файлы (ошибка валидации и т.п.)"""
+        for upload in self.streamed_uploads:
+            if not upload.finalized:
+                upload.discard()
+
+
+class UploadSession:
+    """Сессия загрузки файла по частям (состояние хранится на диске и общее для всех воркеров)"""
+
+    _id_pattern = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+    def __init__(self, meta):
+        self.meta = meta
+
+    @staticmethod
+    def sessions_folder():
+        return os.path.join(Config.UPLOAD_FOLDER, '.sessions')
+
+    @classmethod
+    def _paths(cls, upload_id):
+        base = os.path.join(cls.sessions_folder(), upload_id)
+        return f"{base}.json", f"{base}.part"
+
+    @property
+    def upload_id(self):
+        return self.meta['upload_id']
+
+    @property
+    def size(self):
+        return self.meta['size']
+
+    @property
+    def filename(self):
+        return self.meta['filename']
+
+    @property
+    def telegram_user_id(self):
+        return self.meta.get('telegram_user_id')
+
+    @property
+    def completed(self):
+        return self.meta.get('completed', False)
+
+    @property
+    def offset(self):
+        """Сколько байт уже получено"""
+        return os.path.getsize(self._paths(self.upload_id)[1])
+
+    def to_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': self.offset,
+            'completed': self.completed,
+            'chunk_size': Config.UPLOAD_CHUNK_SIZE
+        }
+
+    @classmethod
+    def create(cls, filename, size, telegram_user_id=None, sha256=None):
+        """Создать сессию загрузки"""
+        if not filename:
+            raise UploadRejected('filename is required')
+        if size <= 0:
+            raise UploadRejected('size must be positive')
+        if size > Config.MAX_FILE_SIZE:
+            raise UploadRejected(
+                f'File size exceeds maximum allowed size of {Config.MAX_FILE_SIZE / 1024 / 1024} MB', 413
+            )
+
+        cls.purge_expired()
+        os.makedirs(cls.sessions_folder(), exist_ok=True)
+        session = cls({
+            'upload_id': secrets.token_urlsafe(24),
+            'filename': filename,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'telegram_user_id': telegram_user_id,
+            'created_at': time.time(),
+            'completed': False
+        })
+        meta_path, part_path = cls._paths(session.upload_id)
+        open(part_path, 'wb').close()
+        session._save()
+        return session
+
+    @classmethod
+    def load(cls, upload_id):
+        """Загрузить сессию по идентификатору; None, если её нет"""
+        if not upload_id or not cls._id_pattern.match(upload_id):
+            return None
+        meta_path, part_path = cls._paths(upload_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(part_path):
+            return None
+        return cls(meta)
+
+    def write_chunk(self, offset, stream, length):
+        """
+        Записать часть файла начиная с offset и вернуть новое смещение.
+
+        Повторная отправка уже полученного диапазона допустима (offset меньше текущего),
+        пропуск данных — нет.
+        """
+        if self.completed:
+            raise UploadRejected('Upload is already finalized', 409)
+        if offset < 0 or offset > self.offset:
+            raise UploadRejected('Invalid offset', 409)
+        if offset + length > self.size:
+            raise UploadRejected('Chunk exceeds declared file size', 413)
+
+        part_path = self._paths(self.upload_id)[1]
+        with open(part_path, 'r+b') as f:
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                data = stream.read(min(64 * 1024, remaining))
+                if not data:
+                    break
+                f.write(data)
+                remaining -= len(data)
+            UPLOAD_BYTES.labels('chunk').inc(length - remaining)
+            # Всё, что было записано после этой части ранее, больше недействительно
+            f.truncate()
+            return f.tell()
+
+    def finalize(self):
+        """Проверить, что файл получен целиком (и совпадает sha256, если он был передан)"""
+        if self.offset != self.size:
+            raise UploadRejected(f'Upload is incomplete: {self.offset} of {self.size} bytes received', 409)
+
+        expected_sha256 = self.meta.get('sha256')
+        if expected_sha256:
+            digest = hashlib.sha256()
+            with open(self._paths(self.upload_id)[1], 'rb') as f:
+                for block in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(block)
+            if digest.hexdigest() != expected_sha256:
+                raise UploadRejected('Checksum mismatch', 422)
+
+        self.meta['completed'] = True
+        self._save()
+
+    def consume(self, filename):
+        """Переместить завершённый файл в UPLOAD_FOLDER под именем filename.
+
+        Сессия остаётся до commit(): если запись формы не сохранится, restore(filename)
+        вернёт файл в сессию и клиент сможет повторить отправку с тем же идентификатором.
+        """
+        part_path = self._paths(self.upload_id)[1]
+        try:
+            os.replace(part_path, os.path.join(Config.UPLOAD_FOLDER, filename))
+        except FileNotFoundError:
+            # Файл уже забран другим запросом с тем же идентификатором
+            raise UploadRejected('Invalid file token')
+
+    def restore(self, filename):
+        """Вернуть в сессию файл, перемещённый consume()"""
+        os.replace(os.path.join(Config.UPLOAD_FOLDER, filename), self._paths(self.upload_id)[1])
+
+    def commit(self):
+        """Удалить сессию, файл которой сохранён с формой"""
+        os.remove(self._paths(self.upload_id)[0])
+
+    def delete(self):
+        for path in self._paths(self.upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _save(self):
+        meta_path = self._paths(self.upload_id)[0]
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, meta_path)
+
+    @classmethod
+    def purge_expired(cls):
+        """Удалить сессии старше UPLOAD_SESSION_TTL (брошенные клиентом загрузки)"""
+        folder = cls.sessions_folder()
+        if not os.path.isdir(folder):
+            return
+        deadline = time.time() - Config.UPLOAD_SESSION_TTL
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name)
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,10 @@
+"""
+Точка входа WSGI для production-сервера.
+
+    flask --app app init-db              # миграции БД (один раз перед запуском)
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app()
+application = app